@@ -7,7 +7,7 @@ import hashlib
 import secrets
 
 
-@dataclass
+@dataclass(slots=True)
 class User:
     """User model for authentication and authorization with session management.
     
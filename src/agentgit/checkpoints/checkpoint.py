@@ -8,7 +8,7 @@ from datetime import datetime
 from typing import Optional, Dict, List, Any
 
 
-@dataclass
+@dataclass(slots=True)
 class Checkpoint:
     """Checkpoint model for saving and restoring LangGraph agent states.
     
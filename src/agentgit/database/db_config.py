@@ -2,16 +2,32 @@
 
 import os
 
+# Default data directory, resolved once at import time.
+_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
+_data_dir_ready = False
+
+
+def _ensure_data_dir() -> str:
+    """Create the default data directory on first use.
+
+    `os.makedirs(exist_ok=True)` still stats the directory on every call,
+    so after the first successful creation the check is skipped entirely.
+
+    Returns:
+        Path to the data directory.
+    """
+    global _data_dir_ready
+    if not _data_dir_ready:
+        os.makedirs(_DATA_DIR, exist_ok=True)
+        _data_dir_ready = True
+    return _DATA_DIR
+
 
 def get_database_path() -> str:
     """Get the path to the SQLite database.
-    
+
     Returns:
         Path to the database file
     """
-    # Create data directory if it doesn't exist
-    data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
-    os.makedirs(data_dir, exist_ok=True)
-    
-    # Return path to database file
-    return os.path.join(data_dir, "rollback_agent.db")
\ No newline at end of file
+    # Return path to database file, creating the data directory if needed
+    return os.path.join(_ensure_data_dir(), "rollback_agent.db")
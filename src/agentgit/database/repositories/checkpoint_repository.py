@@ -5,15 +5,356 @@ Handles CRUD operations for checkpoints in the LangGraph rollback agent system.
 
 import sqlite3
 import json
-from typing import Optional, List, Dict
+import copy
+import functools
+from collections import OrderedDict
+from typing import Optional, List, Dict, Iterator
 from datetime import datetime
 
 from agentgit.checkpoints.checkpoint import Checkpoint
 from agentgit.database.db_config import get_database_path
+from agentgit.database.sqlite_utils import (
+    SharedConnectionMixin,
+    maybe_compress,
+    maybe_decompress,
+    zstandard,
+)
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
-class CheckpointRepository:
+def _encode_payload(obj) -> bytes:
+    """Serialize a checkpoint dict to raw JSON bytes.
+
+    Writing bytes straight into the BLOB column skips the str round trip
+    (and SQLite's UTF-8 encode) that a TEXT column would force on every write.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+
+def _decode_payload(data) -> dict:
+    """Deserialize checkpoint data from bytes (or legacy TEXT rows)."""
+    data = maybe_decompress(data)
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+_CHECKPOINT_COLUMNS = (
+    "id, internal_session_id, checkpoint_name, checkpoint_data, is_auto, created_at"
+)
+
+# SQL hoisted to module level so every call reuses the same str object;
+# SQLite's per-connection statement cache is keyed by the statement text,
+# so reuse skips the parse/plan step on hot queries.
+_SQL_INSERT = """
+    INSERT INTO checkpoints 
+    (internal_session_id, checkpoint_name, checkpoint_data, is_auto, created_at, user_id, has_tools)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+_SQL_GET_BY_ID = f"""
+    SELECT {_CHECKPOINT_COLUMNS}
+    FROM checkpoints
+    WHERE id = ?
+"""
+
+_SQL_GET_BY_SESSION = f"""
+    SELECT {_CHECKPOINT_COLUMNS}
+    FROM checkpoints
+    WHERE internal_session_id = ?
+    ORDER BY created_at DESC
+"""
+
+_SQL_GET_BY_SESSION_AUTO = f"""
+    SELECT {_CHECKPOINT_COLUMNS}
+    FROM checkpoints
+    WHERE internal_session_id = ? AND is_auto = 1
+    ORDER BY created_at DESC
+"""
+
+_SQL_GET_LATEST = f"""
+    SELECT {_CHECKPOINT_COLUMNS}
+    FROM checkpoints
+    WHERE internal_session_id = ?
+    ORDER BY created_at DESC
+    LIMIT 1
+"""
+
+_SQL_GET_WITH_TOOLS = f"""
+    SELECT {_CHECKPOINT_COLUMNS}
+    FROM checkpoints
+    WHERE internal_session_id = ? AND has_tools = 1
+    ORDER BY created_at DESC
+"""
+
+_SQL_GET_BY_USER = f"""
+    SELECT {_CHECKPOINT_COLUMNS}
+    FROM checkpoints
+    WHERE user_id = ?
+    ORDER BY created_at DESC
+    LIMIT ?
+"""
+
+_SQL_SEARCH_FTS = f"""
+    SELECT {', '.join('c.' + col for col in _CHECKPOINT_COLUMNS.split(', '))}
+    FROM checkpoints_fts f
+    JOIN checkpoints c ON c.id = f.rowid
+    WHERE checkpoints_fts MATCH ? AND c.internal_session_id = ?
+    ORDER BY c.created_at DESC
+"""
+
+_SQL_SEARCH_LIKE = f"""
+    SELECT {_CHECKPOINT_COLUMNS}
+    FROM checkpoints
+    WHERE internal_session_id = ? 
+      AND (checkpoint_name LIKE ? OR CAST(checkpoint_data AS TEXT) LIKE ?)
+    ORDER BY created_at DESC
+"""
+
+_SQL_FTS_INSERT = """
+    INSERT INTO checkpoints_fts (rowid, checkpoint_name, checkpoint_data)
+    VALUES (?, ?, ?)
+"""
+
+_SQL_FTS_DELETE_AUTO_KEEP = """
+    DELETE FROM checkpoints_fts
+    WHERE rowid IN (
+        SELECT id FROM checkpoints
+        WHERE internal_session_id = ? AND is_auto = 1
+          AND id NOT IN (
+            SELECT id FROM checkpoints
+            WHERE internal_session_id = ? AND is_auto = 1
+            ORDER BY created_at DESC
+            LIMIT ?
+          )
+    )
+"""
+
+_SQL_FTS_UPDATE = "UPDATE checkpoints_fts SET checkpoint_data = ? WHERE rowid = ?"
+
+# Chunk size for variadic IN clauses, well under SQLITE_MAX_VARIABLE_NUMBER
+_DELETE_CHUNK = 900
+
+# Writes between PRAGMA optimize runs, keeping planner stats fresh
+_OPTIMIZE_EVERY = 1000
+
+_SQL_DELETE_AUTO_KEEP = """
+    DELETE FROM checkpoints
+    WHERE internal_session_id = ? AND is_auto = 1
+      AND id NOT IN (
+        SELECT id FROM checkpoints
+        WHERE internal_session_id = ? AND is_auto = 1
+        ORDER BY created_at DESC
+        LIMIT ?
+      )
+"""
+
+_SQL_COUNT = """
+    SELECT is_auto, COUNT(*)
+    FROM checkpoints
+    WHERE internal_session_id = ?
+    GROUP BY is_auto
+"""
+
+_SQL_UPDATE_DATA = """
+    UPDATE checkpoints
+    SET checkpoint_data = ?
+    WHERE id = ?
+"""
+
+# Server-side metadata updates write one json_set pair per top-level
+# key, so the full payload never round-trips through Python. json_set
+# replaces each addressed value wholesale and stores JSON nulls, exactly
+# matching the dict.update semantics of the fallback path (json_patch
+# would deep-merge and drop None values per RFC 7396). The CAST keeps it
+# working for rows stored as raw JSON bytes; one SQL string is cached
+# per key count so each stays a single prepared statement.
+_METADATA_SET_SQL_VARIANTS = {}
+
+
+def _metadata_set_sql(key_count: int) -> str:
+    """Get (and cache) the json_set UPDATE for a metadata key count."""
+    sql = _METADATA_SET_SQL_VARIANTS.get(key_count)
+    if sql is None:
+        pairs = ", ".join("?, json(?)" for _ in range(key_count))
+        sql = ("UPDATE checkpoints "
+               f"SET checkpoint_data = json_set(CAST(checkpoint_data AS TEXT), {pairs}) "
+               "WHERE id = ?")
+        _METADATA_SET_SQL_VARIANTS[key_count] = sql
+    return sql
+
+_SQL_GET_DATA_TEXT = "SELECT CAST(checkpoint_data AS TEXT) FROM checkpoints WHERE id = ?"
+
+# Assembles the export array inside SQLite; json_patch splices the row id
+# into each payload (which was serialized before the id was assigned).
+_SQL_DUMP_SESSION = """
+    SELECT json_group_array(
+        json(json_patch(CAST(checkpoint_data AS TEXT), json_object('id', id)))
+    )
+    FROM (
+        SELECT id, checkpoint_data FROM checkpoints
+        WHERE internal_session_id = ?
+        ORDER BY created_at DESC
+    )
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def _ensure_schema(db_path: str) -> bool:
+    """Create the checkpoints schema for ``db_path``, once per process.
+
+    Repositories are cheap to construct per request, but the DDL probe
+    (CREATE TABLE + indexes + migrations) is not, and it serializes on the
+    schema lock. lru_cache makes repeat constructions for the same path a
+    dict hit. BEGIN IMMEDIATE plus IF NOT EXISTS statements keep the first
+    run safe against concurrent worker processes.
+
+    Args:
+        db_path: Path to the SQLite database file.
+
+    Returns:
+        True if the FTS5 search table is available, False otherwise.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                internal_session_id INTEGER NOT NULL,
+                checkpoint_name TEXT,
+                checkpoint_data BLOB NOT NULL,
+                is_auto INTEGER DEFAULT 0,
+                created_at INTEGER NOT NULL,
+                user_id INTEGER,
+                has_tools INTEGER DEFAULT 0,
+                FOREIGN KEY (internal_session_id) REFERENCES internal_sessions(id) ON DELETE CASCADE,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
+            )
+        """)
+        
+        # Check if we need to add user_id column (for migration)
+        cursor.execute("PRAGMA table_info(checkpoints)")
+        columns = [column[1] for column in cursor.fetchall()]
+        
+        if 'user_id' not in columns:
+            cursor.execute("ALTER TABLE checkpoints ADD COLUMN user_id INTEGER")
+        
+        if 'has_tools' not in columns:
+            cursor.execute("ALTER TABLE checkpoints ADD COLUMN has_tools INTEGER DEFAULT 0")
+            # Backfill legacy TEXT rows; JSON functions reject BLOBs, so
+            # rows written as raw bytes keep the 0 default they got above.
+            cursor.execute("""
+                UPDATE checkpoints
+                SET has_tools = CASE
+                    WHEN json_array_length(checkpoint_data, '$.tool_invocations') > 0 THEN 1
+                    ELSE 0 END
+                WHERE typeof(checkpoint_data) = 'text'
+            """)
+
+        # created_at is only ever sorted on (reads take the timestamp
+        # from the JSON payload), so store it as epoch microseconds:
+        # integer index keys compare in one op instead of a 26-byte
+        # strcmp. Legacy databases declare the column TEXT, so the
+        # converted value lands back as a digit string — the LIKE guard
+        # (ISO strings contain '-', epoch strings don't) keeps the
+        # rewrite idempotent instead of re-running strftime on digit
+        # strings and NULLing the column. Ordering stays well-defined:
+        # affinity keeps each database's storage class uniform (a TEXT
+        # column coerces new integer binds too), and equal-width digit
+        # strings sort identically to their values. The 'utc' modifier
+        # matters: legacy strings are naive local times from
+        # datetime.now().isoformat(), and without it strftime reads them
+        # as UTC, shifting every row by the host's UTC offset.
+        cursor.execute("""
+            UPDATE checkpoints
+            SET created_at = CAST(strftime('%s', created_at, 'utc') AS INTEGER) * 1000000
+                + CAST(substr(created_at, 21, 6) AS INTEGER)
+            WHERE typeof(created_at) = 'text' AND created_at LIKE '%-%'
+        """)
+
+
+        # Composite index serving the (session, is_auto) filters with
+        # their created_at DESC ordering via a range scan instead of a
+        # filtered sort; it also covers the NOT IN subquery of
+        # delete_auto_checkpoints. The old single-column session index
+        # is a strict prefix of this one, so drop it.
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_checkpoints_session_auto_created
+            ON checkpoints(internal_session_id, is_auto, created_at DESC)
+        """)
+        cursor.execute("DROP INDEX IF EXISTS idx_checkpoints_session")
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_checkpoints_session_tools
+            ON checkpoints(internal_session_id, has_tools)
+        """)
+
+        # Partial index for the auto-only paths (auto-only listing and the
+        # keep-latest subquery of delete_auto_checkpoints). It holds just
+        # the auto rows, so scans touch a fraction of the full composite
+        # index and need no is_auto predicate per entry.
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_checkpoints_auto_session_created
+            ON checkpoints(internal_session_id, created_at DESC)
+            WHERE is_auto = 1
+        """)
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_checkpoints_created
+            ON checkpoints(created_at DESC)
+        """)
+
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_checkpoints_user_created
+            ON checkpoints(user_id, created_at DESC)
+        """)
+        cursor.execute("DROP INDEX IF EXISTS idx_checkpoints_user")
+
+        # Full-text shadow table for search_checkpoints; maintained from
+        # the write paths rather than triggers so it always indexes the
+        # plain JSON text regardless of how the blob column is encoded.
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS checkpoints_fts
+                USING fts5(checkpoint_name, checkpoint_data)
+            """)
+            # Index any checkpoints written before the FTS table existed
+            # (or while it was unavailable); without this, pre-upgrade
+            # rows silently vanish from search_checkpoints. zstd frames
+            # (leading bytes = ZSTD_MAGIC) are opaque to tokenization
+            # and were only ever written together with their FTS entry,
+            # so they are skipped rather than indexed as binary noise.
+            cursor.execute("""
+                INSERT INTO checkpoints_fts (rowid, checkpoint_name, checkpoint_data)
+                SELECT id, checkpoint_name, CAST(checkpoint_data AS TEXT)
+                FROM checkpoints
+                WHERE id NOT IN (SELECT rowid FROM checkpoints_fts)
+                  AND substr(CAST(checkpoint_data AS BLOB), 1, 4) != x'28b52ffd'
+            """)
+            fts_enabled = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5; search falls back to LIKE scans
+            fts_enabled = False
+
+        # Refresh planner statistics so the new indexes get picked up
+        cursor.execute("ANALYZE checkpoints")
+
+        conn.commit()
+        return fts_enabled
+    finally:
+        conn.close()
+
+
+class CheckpointRepository(SharedConnectionMixin):
     """Repository for Checkpoint CRUD operations with SQLite.
     
     Manages checkpoints which capture complete agent state at specific points,
@@ -28,64 +369,112 @@ class CheckpointRepository:
         >>> saved = repo.create(checkpoint)
         >>> checkpoints = repo.get_by_internal_session(1)
     """
-    
-    def __init__(self, db_path: Optional[str] = None):
+
+    _savepoint_prefix = "ckpt_txn"
+
+    def __init__(self, db_path: Optional[str] = None, cache_size: int = 128):
         """Initialize the checkpoint repository.
-        
+
         Args:
             db_path: Path to SQLite database. If None, uses configured default.
+            cache_size: Number of checkpoints kept in the read cache. Pass 0
+                to disable caching (e.g. when several processes write the
+                same database).
         """
         self.db_path = db_path or get_database_path()
-        self._init_db()
-    
-    def _init_db(self):
-        """Initialize the checkpoints table if it doesn't exist."""
-        conn = sqlite3.connect(self.db_path)
-        try:
-            cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
-            
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS checkpoints (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    internal_session_id INTEGER NOT NULL,
-                    checkpoint_name TEXT,
-                    checkpoint_data TEXT NOT NULL,
-                    is_auto INTEGER DEFAULT 0,
-                    created_at TEXT NOT NULL,
-                    user_id INTEGER,
-                    FOREIGN KEY (internal_session_id) REFERENCES internal_sessions(id) ON DELETE CASCADE,
-                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
-                )
-            """)
-            
-            # Check if we need to add user_id column (for migration)
-            cursor.execute("PRAGMA table_info(checkpoints)")
-            columns = [column[1] for column in cursor.fetchall()]
-            
-            if 'user_id' not in columns:
-                cursor.execute("ALTER TABLE checkpoints ADD COLUMN user_id INTEGER")
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_checkpoints_session 
-                ON checkpoints(internal_session_id)
-            """)
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_checkpoints_created 
-                ON checkpoints(created_at DESC)
-            """)
-            
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_checkpoints_user 
-                ON checkpoints(user_id)
-            """)
-            
+        self._init_connection_state()
+        self._cache_size = cache_size
+        self._ckpt_cache: "OrderedDict[int, Checkpoint]" = OrderedDict()
+        self._latest_ids: Dict[int, int] = {}
+        self._writes_since_optimize = 0
+        self._fts_enabled = _ensure_schema(self.db_path)
+
+    @staticmethod
+    def _cache_copy(checkpoint: Checkpoint) -> Checkpoint:
+        """Shallow-copy a cached checkpoint, detaching the metadata dict.
+
+        metadata is the field callers merge into after a fetch, so give each
+        copy its own dict; the heavyweight state/history payloads stay shared.
+        """
+        out = copy.copy(checkpoint)
+        out.metadata = dict(checkpoint.metadata)
+        return out
+
+    def _cache_put(self, checkpoint: Checkpoint):
+        """Remember a freshly loaded checkpoint, evicting the oldest entry."""
+        if not self._cache_size:
+            return
+        with self._lock:
+            self._ckpt_cache[checkpoint.id] = checkpoint
+            self._ckpt_cache.move_to_end(checkpoint.id)
+            while len(self._ckpt_cache) > self._cache_size:
+                self._ckpt_cache.popitem(last=False)
+
+    def _cache_get(self, checkpoint_id: int) -> Optional[Checkpoint]:
+        """Return a copy of a cached checkpoint, or None on miss."""
+        if not self._cache_size:
+            return None
+        with self._lock:
+            cached = self._ckpt_cache.get(checkpoint_id)
+            if cached is None:
+                return None
+            self._ckpt_cache.move_to_end(checkpoint_id)
+            # Copy so callers mutating the result (e.g. metadata merges)
+            # don't corrupt the cached instance.
+            return self._cache_copy(cached)
+
+    def _cache_evict(self, checkpoint_id: int):
+        """Drop a checkpoint (and any latest-pointer to it) from the cache."""
+        with self._lock:
+            self._ckpt_cache.pop(checkpoint_id, None)
+            for session_id, latest_id in list(self._latest_ids.items()):
+                if latest_id == checkpoint_id:
+                    del self._latest_ids[session_id]
+
+    def _cache_evict_session_autos(self, internal_session_id: int):
+        """Drop cached auto checkpoints of a session after a bulk delete."""
+        with self._lock:
+            self._latest_ids.pop(internal_session_id, None)
+            for cid, cp in list(self._ckpt_cache.items()):
+                if cp.internal_session_id == internal_session_id and cp.is_auto:
+                    del self._ckpt_cache[cid]
+
+    def _maybe_commit(self, conn: sqlite3.Connection):
+        """Commit unless running inside an explicit transaction() block.
+
+        Also refreshes planner statistics every _OPTIMIZE_EVERY writes:
+        long-lived connections otherwise keep row estimates from before a
+        write burst, which skews plans for queries like search_checkpoints.
+        PRAGMA optimize only reanalyzes what changed, so it is cheap.
+        """
+        self._writes_since_optimize += 1
+        if self._txn_depth == 0:
             conn.commit()
-        finally:
-            conn.close()
-    
+            if self._writes_since_optimize >= _OPTIMIZE_EVERY:
+                self._writes_since_optimize = 0
+                conn.execute("PRAGMA optimize")
+
+    def close(self):
+        """Close the shared connection and drop cached reads.
+
+        Optional — the connection is reclaimed at interpreter exit anyway —
+        but long-lived services cycling many repositories can call this to
+        release the database file handles early. The repository reopens
+        lazily if used again.
+        """
+        with self._lock:
+            if self._shared_conn is not None:
+                try:
+                    # Fold the WAL back into the main file so it doesn't keep
+                    # growing across service restarts.
+                    self._shared_conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                except sqlite3.OperationalError:
+                    pass
+                self._shared_conn.close()
+                self._shared_conn = None
+            self._ckpt_cache.clear()
+            self._latest_ids.clear()
+
     def create(self, checkpoint: Checkpoint) -> Checkpoint:
         """Create a new checkpoint.
         
@@ -95,37 +484,65 @@ class CheckpointRepository:
         Returns:
             The created checkpoint with id populated.
         """
-        if not checkpoint.created_at:
-            checkpoint.created_at = datetime.now()
-        
-        checkpoint_dict = checkpoint.to_dict()
-        json_data = json.dumps(checkpoint_dict)
-        
-        conn = sqlite3.connect(self.db_path)
-        try:
-            cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
-            
-            cursor.execute("""
-                INSERT INTO checkpoints 
-                (internal_session_id, checkpoint_name, checkpoint_data, is_auto, created_at, user_id)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (
+        return self.create_many([checkpoint])[0]
+
+    def create_many(self, checkpoints: List[Checkpoint]) -> List[Checkpoint]:
+        """Create several checkpoints in a single transaction.
+
+        Auto-checkpointing produces bursts of inserts, and committing each one
+        separately costs one fsync per checkpoint. Batching the burst through
+        executemany with a single commit amortizes that cost.
+
+        Args:
+            checkpoints: Checkpoint objects to create.
+
+        Returns:
+            The created checkpoints with ids populated.
+        """
+        if not checkpoints:
+            return []
+
+        rows = []
+        payloads = []
+        for checkpoint in checkpoints:
+            if not checkpoint.created_at:
+                checkpoint.created_at = datetime.now()
+            payload = _encode_payload(checkpoint.to_dict())
+            payloads.append(payload)
+            rows.append((
                 checkpoint.internal_session_id,
                 checkpoint.checkpoint_name,
-                json_data,
+                maybe_compress(payload),
                 1 if checkpoint.is_auto else 0,
-                checkpoint.created_at.isoformat(),
-                checkpoint.user_id
+                int(checkpoint.created_at.timestamp() * 1_000_000),
+                checkpoint.user_id,
+                1 if checkpoint.has_tool_invocations() else 0
             ))
-            
-            checkpoint.id = cursor.lastrowid
-            conn.commit()
-        finally:
-            conn.close()
-        
-        return checkpoint
+
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(_SQL_INSERT, rows)
+
+            # One INSERT statement executed under the repository lock, so the
+            # assigned rowids are contiguous; backfill ids from the last one.
+            cursor.execute("SELECT last_insert_rowid()")
+            first_id = cursor.fetchone()[0] - len(rows) + 1
+            for i, checkpoint in enumerate(checkpoints):
+                checkpoint.id = first_id + i
+
+            if self._fts_enabled:
+                cursor.executemany(_SQL_FTS_INSERT, [
+                    (cp.id, cp.checkpoint_name, payload.decode())
+                    for cp, payload in zip(checkpoints, payloads)
+                ])
+
+            self._maybe_commit(conn)
+
+        if self._cache_size:
+            for checkpoint in checkpoints:
+                self._latest_ids[checkpoint.internal_session_id] = checkpoint.id
+
+        return checkpoints
     
     def get_by_id(self, checkpoint_id: int) -> Optional[Checkpoint]:
         """Get a checkpoint by ID.
@@ -136,24 +553,20 @@ class CheckpointRepository:
         Returns:
             Checkpoint if found, None otherwise.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        cached = self._cache_get(checkpoint_id)
+        if cached is not None:
+            return cached
+
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             
-            cursor.execute("""
-                SELECT id, internal_session_id, checkpoint_name, checkpoint_data, 
-                       is_auto, created_at
-                FROM checkpoints
-                WHERE id = ?
-            """, (checkpoint_id,))
+            cursor.execute(_SQL_GET_BY_ID, (checkpoint_id,))
             
             row = cursor.fetchone()
             if row:
-                return self._row_to_checkpoint(row)
-        finally:
-            conn.close()
+                checkpoint = self._row_to_checkpoint(row)
+                self._cache_put(checkpoint)
+                return self._cache_copy(checkpoint)
         
         return None
     
@@ -168,33 +581,85 @@ class CheckpointRepository:
         Returns:
             List of Checkpoint objects, ordered by created_at descending.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             
             if auto_only:
-                cursor.execute("""
-                    SELECT id, internal_session_id, checkpoint_name, checkpoint_data, 
-                           is_auto, created_at
-                    FROM checkpoints
-                    WHERE internal_session_id = ? AND is_auto = 1
-                    ORDER BY created_at DESC
-                """, (internal_session_id,))
+                cursor.execute(_SQL_GET_BY_SESSION_AUTO, (internal_session_id,))
             else:
-                cursor.execute("""
-                    SELECT id, internal_session_id, checkpoint_name, checkpoint_data, 
-                           is_auto, created_at
-                    FROM checkpoints
-                    WHERE internal_session_id = ?
-                    ORDER BY created_at DESC
-                """, (internal_session_id,))
+                cursor.execute(_SQL_GET_BY_SESSION, (internal_session_id,))
             
-            rows = cursor.fetchall()
-            return [self._row_to_checkpoint(row) for row in rows]
-        finally:
-            conn.close()
+            return self._rows_to_checkpoints(cursor.fetchall())
+
+    def get_by_internal_sessions(
+            self, internal_session_ids: List[int]) -> Dict[int, List[Checkpoint]]:
+        """Get checkpoints for several internal sessions in one query.
+
+        Callers fanning out over many sessions (e.g. building a branch
+        overview) previously looped get_by_internal_session, paying one
+        query per session. A single IN-clause range-merge off the session
+        index replaces that, with ids chunked to stay under SQLite's
+        placeholder limit.
+
+        Args:
+            internal_session_ids: IDs of the internal sessions.
+
+        Returns:
+            Mapping of session id to its checkpoints, newest first. Sessions
+            without checkpoints map to empty lists.
+        """
+        results: Dict[int, List[Checkpoint]] = {
+            sid: [] for sid in internal_session_ids
+        }
+        if not results:
+            return results
+
+        rows = []
+        ids = list(results)
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(ids), _DELETE_CHUNK):
+                chunk = ids[start:start + _DELETE_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(
+                    f"SELECT {_CHECKPOINT_COLUMNS} FROM checkpoints "
+                    f"WHERE internal_session_id IN ({placeholders}) "
+                    "ORDER BY created_at DESC",
+                    chunk
+                )
+                rows.extend(cursor.fetchall())
+
+        # A session's rows all come from the same chunk, so the per-session
+        # created_at DESC order survives the bucketing.
+        for checkpoint in self._rows_to_checkpoints(rows):
+            results[checkpoint.internal_session_id].append(checkpoint)
+        return results
+
+    def iter_by_internal_session(self, internal_session_id: int,
+                                 auto_only: bool = False) -> Iterator[Checkpoint]:
+        """Iterate over checkpoints for an internal session.
+
+        Streams rows off the cursor one at a time instead of materializing
+        the full list, keeping peak memory independent of session size.
+
+        Args:
+            internal_session_id: The ID of the internal session.
+            auto_only: If True, only yield automatic checkpoints.
+
+        Yields:
+            Checkpoint objects, ordered by created_at descending.
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.arraysize = 256
+            
+            if auto_only:
+                cursor.execute(_SQL_GET_BY_SESSION_AUTO, (internal_session_id,))
+            else:
+                cursor.execute(_SQL_GET_BY_SESSION, (internal_session_id,))
+            
+            for row in cursor:
+                yield self._row_to_checkpoint(row)
     
     def get_latest_checkpoint(self, internal_session_id: int) -> Optional[Checkpoint]:
         """Get the most recent checkpoint for an internal session.
@@ -205,26 +670,25 @@ class CheckpointRepository:
         Returns:
             The latest Checkpoint if found, None otherwise.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        latest_id = self._latest_ids.get(internal_session_id)
+        if latest_id is not None:
+            cached = self._cache_get(latest_id)
+            if cached is not None:
+                return cached
+
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             
-            cursor.execute("""
-                SELECT id, internal_session_id, checkpoint_name, checkpoint_data, 
-                       is_auto, created_at
-                FROM checkpoints
-                WHERE internal_session_id = ?
-                ORDER BY created_at DESC
-                LIMIT 1
-            """, (internal_session_id,))
+            cursor.execute(_SQL_GET_LATEST, (internal_session_id,))
             
             row = cursor.fetchone()
             if row:
-                return self._row_to_checkpoint(row)
-        finally:
-            conn.close()
+                checkpoint = self._row_to_checkpoint(row)
+                if self._cache_size:
+                    self._latest_ids[internal_session_id] = checkpoint.id
+                    self._cache_put(checkpoint)
+                    return self._cache_copy(checkpoint)
+                return checkpoint
         
         return None
     
@@ -237,20 +701,45 @@ class CheckpointRepository:
         Returns:
             True if deletion successful, False otherwise.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        return self.delete_many([checkpoint_id]) > 0
+
+    def delete_many(self, checkpoint_ids: List[int]) -> int:
+        """Delete several checkpoints in a single transaction.
+
+        Session cleanup paths delete whole batches; doing it per id costs a
+        round trip and a commit each. This issues chunked IN-clause deletes
+        and commits once.
+
+        Args:
+            checkpoint_ids: IDs of the checkpoints to delete.
+
+        Returns:
+            Number of checkpoints deleted.
+        """
+        if not checkpoint_ids:
+            return 0
+
+        deleted = 0
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
-            
-            cursor.execute("""
-                DELETE FROM checkpoints WHERE id = ?
-            """, (checkpoint_id,))
             
-            conn.commit()
-            return cursor.rowcount > 0
-        finally:
-            conn.close()
+            for start in range(0, len(checkpoint_ids), _DELETE_CHUNK):
+                chunk = checkpoint_ids[start:start + _DELETE_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                if self._fts_enabled:
+                    cursor.execute(
+                        f"DELETE FROM checkpoints_fts WHERE rowid IN ({placeholders})",
+                        chunk)
+                cursor.execute(
+                    f"DELETE FROM checkpoints WHERE id IN ({placeholders})",
+                    chunk)
+                deleted += cursor.rowcount
+            
+            for checkpoint_id in checkpoint_ids:
+                self._cache_evict(checkpoint_id)
+            self._maybe_commit(conn)
+        
+        return deleted
     
     def delete_auto_checkpoints(self, internal_session_id: int, keep_latest: int = 5) -> int:
         """Delete old automatic checkpoints, keeping only the most recent ones.
@@ -262,40 +751,21 @@ class CheckpointRepository:
         Returns:
             Number of checkpoints deleted.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             
-            # Find IDs of checkpoints to keep
-            cursor.execute("""
-                SELECT id FROM checkpoints
-                WHERE internal_session_id = ? AND is_auto = 1
-                ORDER BY created_at DESC
-                LIMIT ?
-            """, (internal_session_id, keep_latest))
-            
-            keep_ids = [row[0] for row in cursor.fetchall()]
-            
-            if keep_ids:
-                # Delete auto checkpoints not in the keep list
-                placeholders = ','.join('?' * len(keep_ids))
-                cursor.execute(f"""
-                    DELETE FROM checkpoints
-                    WHERE internal_session_id = ? AND is_auto = 1 AND id NOT IN ({placeholders})
-                """, [internal_session_id] + keep_ids)
-            else:
-                # Delete all auto checkpoints if none to keep
-                cursor.execute("""
-                    DELETE FROM checkpoints
-                    WHERE internal_session_id = ? AND is_auto = 1
-                """, (internal_session_id,))
-            
-            conn.commit()
+            # Single statement: the ids to keep stay inside SQLite's planner
+            # instead of round-tripping through Python placeholders. With
+            # keep_latest <= 0 the subquery is empty, deleting all auto rows.
+            if self._fts_enabled:
+                cursor.execute(_SQL_FTS_DELETE_AUTO_KEEP,
+                               (internal_session_id, internal_session_id, keep_latest))
+            cursor.execute(_SQL_DELETE_AUTO_KEEP,
+                           (internal_session_id, internal_session_id, keep_latest))
+            
+            self._cache_evict_session_autos(internal_session_id)
+            self._maybe_commit(conn)
             return cursor.rowcount
-        finally:
-            conn.close()
     
     def count_checkpoints(self, internal_session_id: int) -> Dict[str, int]:
         """Count checkpoints for an internal session.
@@ -306,33 +776,40 @@ class CheckpointRepository:
         Returns:
             Dictionary with counts: {'total': n, 'auto': n, 'manual': n}
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
-            
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as total,
-                    SUM(CASE WHEN is_auto = 1 THEN 1 ELSE 0 END) as auto,
-                    SUM(CASE WHEN is_auto = 0 THEN 1 ELSE 0 END) as manual
-                FROM checkpoints
-                WHERE internal_session_id = ?
-            """, (internal_session_id,))
-            
-            row = cursor.fetchone()
-            if row:
-                return {
-                    'total': row[0] or 0,
-                    'auto': row[1] or 0,
-                    'manual': row[2] or 0
-                }
-            
-            return {'total': 0, 'auto': 0, 'manual': 0}
-        finally:
-            conn.close()
+
+            cursor.execute(_SQL_COUNT, (internal_session_id,))
+
+            # GROUP BY is_auto counts straight off the composite index
+            # prefix: at most two rows back, no per-row CASE evaluation.
+            counts = {'total': 0, 'auto': 0, 'manual': 0}
+            for is_auto, count in cursor.fetchall():
+                counts['auto' if is_auto else 'manual'] = count
+                counts['total'] += count
+            return counts
     
+    def iter_by_user(self, user_id: int) -> Iterator[Checkpoint]:
+        """Iterate over all checkpoints for a user.
+
+        Streaming counterpart to get_by_user for large result sets; yields
+        one decoded Checkpoint per cursor row so peak memory stays flat.
+
+        Args:
+            user_id: The ID of the user.
+
+        Yields:
+            Checkpoint objects, ordered by created_at descending.
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.arraysize = 256
+
+            cursor.execute(_SQL_GET_BY_USER, (user_id, -1))
+
+            for row in cursor:
+                yield self._row_to_checkpoint(row)
+
     def get_by_user(self, user_id: int, limit: Optional[int] = None) -> List[Checkpoint]:
         """Get all checkpoints for a specific user.
         
@@ -343,29 +820,39 @@ class CheckpointRepository:
         Returns:
             List of Checkpoint objects, ordered by created_at descending.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
-            
-            query = """
-                SELECT id, internal_session_id, checkpoint_name, checkpoint_data, 
-                       is_auto, created_at
-                FROM checkpoints
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-            """
-            
-            if limit:
-                query += f" LIMIT {limit}"
-            
-            cursor.execute(query, (user_id,))
-            rows = cursor.fetchall()
-            return [self._row_to_checkpoint(row) for row in rows]
-        finally:
-            conn.close()
+
+            # LIMIT is bound rather than spliced so every call shares one
+            # cached plan; SQLite treats LIMIT -1 as unbounded.
+            cursor.execute(_SQL_GET_BY_USER, (user_id, limit if limit else -1))
+            return self._rows_to_checkpoints(cursor.fetchall())
     
+    def dump_session_as_json(self, internal_session_id: int) -> bytes:
+        """Export all checkpoints of a session as one JSON array.
+
+        For re-serialization consumers (session export, backups) decoding
+        every row into Checkpoint objects just to dump them again is wasted
+        work. When payloads are stored uncompressed, SQLite assembles the
+        whole array with json_group_array, so Python never parses a byte of
+        checkpoint data.
+
+        Args:
+            internal_session_id: The ID of the internal session.
+
+        Returns:
+            UTF-8 JSON bytes: an array of checkpoint dicts, newest first.
+        """
+        if zstandard is None:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(_SQL_DUMP_SESSION, (internal_session_id,))
+                return cursor.fetchone()[0].encode()
+
+        # Compressed blobs are opaque to JSON1, so decode in Python.
+        checkpoints = self.get_by_internal_session(internal_session_id)
+        return _encode_payload([cp.to_dict() for cp in checkpoints])
+
     def get_checkpoints_with_tools(self, internal_session_id: int) -> List[Checkpoint]:
         """Get checkpoints that have tool invocations.
         
@@ -375,9 +862,11 @@ class CheckpointRepository:
         Returns:
             List of Checkpoint objects that have tool invocations.
         """
-        checkpoints = self.get_by_internal_session(internal_session_id)
-        # Filter checkpoints that have tool invocations
-        return [cp for cp in checkpoints if cp.has_tool_invocations()]
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(_SQL_GET_WITH_TOOLS, (internal_session_id,))
+            return self._rows_to_checkpoints(cursor.fetchall())
     
     def update_checkpoint_metadata(self, checkpoint_id: int, metadata: Dict) -> bool:
         """Update the metadata of a checkpoint.
@@ -391,31 +880,63 @@ class CheckpointRepository:
         Returns:
             True if update successful, False otherwise.
         """
+        if zstandard is not None:
+            # Rows are compressed at rest; json_set cannot see into them,
+            # so take the decode-merge-reencode path.
+            return self._update_metadata_fallback(checkpoint_id, metadata)
+
+        if not metadata:
+            return self.get_by_id(checkpoint_id) is not None
+
+        params = []
+        for key, value in metadata.items():
+            if '"' in key:
+                # Not expressible as a quoted JSON path label; merge in
+                # Python instead.
+                return self._update_metadata_fallback(checkpoint_id, metadata)
+            params.append(f'$.metadata."{key}"')
+            params.append(_encode_payload(value).decode())
+        params.append(checkpoint_id)
+
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            self._cache_evict(checkpoint_id)
+            try:
+                cursor.execute(_metadata_set_sql(len(metadata)), params)
+            except sqlite3.OperationalError:
+                # SQLite built without the JSON1 functions
+                return self._update_metadata_fallback(checkpoint_id, metadata)
+            
+            if cursor.rowcount == 0:
+                return False
+            
+            if self._fts_enabled:
+                row = cursor.execute(_SQL_GET_DATA_TEXT, (checkpoint_id,)).fetchone()
+                cursor.execute(_SQL_FTS_UPDATE, (row[0], checkpoint_id))
+            self._maybe_commit(conn)
+            return True
+
+    def _update_metadata_fallback(self, checkpoint_id: int, metadata: Dict) -> bool:
+        """Fetch-merge-rewrite metadata update for JSON1-less SQLite builds."""
         checkpoint = self.get_by_id(checkpoint_id)
         if not checkpoint:
             return False
         
-        # Merge metadata
         checkpoint.metadata.update(metadata)
+        json_data = _encode_payload(checkpoint.to_dict())
         
-        # Save updated checkpoint
-        checkpoint_dict = checkpoint.to_dict()
-        json_data = json.dumps(checkpoint_dict)
-        
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
-            cursor.execute("""
-                UPDATE checkpoints
-                SET checkpoint_data = ?
-                WHERE id = ?
-            """, (json_data, checkpoint_id))
-            conn.commit()
-            return cursor.rowcount > 0
-        finally:
-            conn.close()
+            self._cache_evict(checkpoint_id)
+            cursor.execute(_SQL_UPDATE_DATA, (maybe_compress(json_data), checkpoint_id))
+            # Captured before the FTS statement reuses the cursor; the
+            # shadow row may legitimately be absent (zstd-compressed rows
+            # are never indexed) and must not mask a successful update.
+            updated = cursor.rowcount > 0
+            if self._fts_enabled:
+                cursor.execute(_SQL_FTS_UPDATE, (json_data.decode(), checkpoint_id))
+            self._maybe_commit(conn)
+            return updated
     
     def search_checkpoints(self, internal_session_id: int, search_term: str) -> List[Checkpoint]:
         """Search checkpoints by name or content.
@@ -427,26 +948,52 @@ class CheckpointRepository:
         Returns:
             List of matching Checkpoint objects.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             
-            cursor.execute("""
-                SELECT id, internal_session_id, checkpoint_name, checkpoint_data, 
-                       is_auto, created_at
-                FROM checkpoints
-                WHERE internal_session_id = ? 
-                  AND (checkpoint_name LIKE ? OR checkpoint_data LIKE ?)
-                ORDER BY created_at DESC
-            """, (internal_session_id, f"%{search_term}%", f"%{search_term}%"))
+            if self._fts_enabled:
+                # Quote the term as a prefix phrase so user input is never
+                # parsed as FTS query syntax.
+                match = '"' + search_term.replace('"', '""') + '"*'
+                cursor.execute(_SQL_SEARCH_FTS, (match, internal_session_id))
+            else:
+                cursor.execute(_SQL_SEARCH_LIKE,
+                               (internal_session_id, f"%{search_term}%", f"%{search_term}%"))
             
-            rows = cursor.fetchall()
-            return [self._row_to_checkpoint(row) for row in rows]
-        finally:
-            conn.close()
+            return self._rows_to_checkpoints(cursor.fetchall())
     
+    def _rows_to_checkpoints(self, rows) -> List[Checkpoint]:
+        """Decode a batch of rows in a single pass.
+
+        With orjson available, the payloads are joined into one JSON array
+        and parsed by a single C-level call, instead of re-entering the
+        parser once per row.
+
+        Args:
+            rows: List of tuples from a checkpoint SELECT.
+
+        Returns:
+            List of Checkpoint objects in row order.
+        """
+        if orjson is None or not rows:
+            return [self._row_to_checkpoint(row) for row in rows]
+
+        payloads = []
+        for row in rows:
+            data = maybe_decompress(row[3])
+            if not isinstance(data, bytes):
+                data = data.encode()
+            payloads.append(data)
+
+        dicts = orjson.loads(b"[" + b",".join(payloads) + b"]")
+
+        checkpoints = []
+        for row, checkpoint_dict in zip(rows, dicts):
+            checkpoint = Checkpoint.from_dict(checkpoint_dict)
+            checkpoint.id = row[0]
+            checkpoints.append(checkpoint)
+        return checkpoints
+
     def _row_to_checkpoint(self, row) -> Checkpoint:
         """Convert a database row to a Checkpoint object.
         
@@ -458,7 +1005,7 @@ class CheckpointRepository:
         """
         checkpoint_id, internal_session_id, checkpoint_name, json_data, is_auto, created_at = row
         
-        checkpoint_dict = json.loads(json_data)
+        checkpoint_dict = _decode_payload(json_data)
         checkpoint = Checkpoint.from_dict(checkpoint_dict)
         checkpoint.id = checkpoint_id  # Ensure ID is set
         
@@ -3,17 +3,192 @@
 Handles CRUD operations for internal langgraph sessions in the rollback agent system.
 """
 
-import sqlite3
 import json
+import copy
+from collections import OrderedDict
 from typing import Optional, List
 from datetime import datetime
 
 from agentgit.sessions.internal_session import InternalSession
 from agentgit.database.db_config import get_database_path
+from agentgit.database.sqlite_utils import (
+    SharedConnectionMixin,
+    maybe_compress,
+    maybe_decompress,
+)
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
-class InternalSessionRepository:
+def _dumps(obj) -> bytes:
+    """Encode a JSON column value, preferring orjson's C encoder.
+
+    Large values are zstd-compressed, halving (or better) the bytes
+    pushed through the page cache and fsynced on every update.
+    """
+    if orjson is not None:
+        payload = orjson.dumps(obj)
+    else:
+        payload = json.dumps(obj).encode()
+    return maybe_compress(payload)
+
+
+def _loads(data):
+    """Decode a JSON column value (bytes from new rows, str from legacy)."""
+    data = maybe_decompress(data)
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Pre-bound at module scope so the per-row hot path resolves these with
+# one fast global lookup instead of an attribute lookup per row.
+_fromtimestamp = datetime.fromtimestamp
+
+_SESSION_COLUMNS = (
+    "id, external_session_id, langgraph_session_id, state_data, "
+    "conversation_history, created_at, is_current, checkpoint_count, "
+    "parent_session_id, branch_point_checkpoint_id, "
+    "tool_invocation_count, metadata"
+)
+
+# SQL hoisted to module constants: the connection's statement cache is
+# keyed by statement text, so passing the identical string every call
+# skips the parse/plan step.
+_SQL_INSERT = """
+    INSERT INTO internal_sessions 
+    (external_session_id, langgraph_session_id, state_data, conversation_history, 
+     created_at, is_current, checkpoint_count, parent_session_id,
+     branch_point_checkpoint_id, tool_invocation_count, metadata)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Single-row variant: RETURNING hands back the assigned id in the same
+# statement, avoiding the follow-up last_insert_rowid() round trip.
+_SQL_INSERT_RETURNING = _SQL_INSERT + "    RETURNING id\n"
+
+_SQL_UPDATE = """
+    UPDATE internal_sessions 
+    SET state_data = ?, conversation_history = ?, is_current = ?, 
+        checkpoint_count = ?, tool_invocation_count = ?, metadata = ?
+    WHERE id = ?
+"""
+
+_SQL_GET_BY_ID = f"""
+    SELECT {_SESSION_COLUMNS}
+    FROM internal_sessions
+    WHERE id = ?
+"""
+
+_SQL_GET_BY_LANGGRAPH = f"""
+    SELECT {_SESSION_COLUMNS}
+    FROM internal_sessions
+    WHERE langgraph_session_id = ?
+"""
+
+_SQL_GET_BY_EXTERNAL = f"""
+    SELECT {_SESSION_COLUMNS}
+    FROM internal_sessions
+    WHERE external_session_id = ?
+    ORDER BY created_at DESC
+"""
+
+_SQL_GET_CURRENT = f"""
+    SELECT {_SESSION_COLUMNS}
+    FROM internal_sessions
+    WHERE external_session_id = ? AND is_current = 1
+    LIMIT 1
+"""
+
+_SQL_GET_BRANCHES = f"""
+    SELECT {_SESSION_COLUMNS}
+    FROM internal_sessions
+    WHERE parent_session_id = ?
+    ORDER BY created_at DESC
+"""
+
+# Walks parent_session_id links in one statement instead of one SELECT
+# per ancestor; rows come back child-first and are reversed in Python.
+_SQL_GET_LINEAGE = f"""
+    WITH RECURSIVE lineage AS (
+        SELECT {_SESSION_COLUMNS}
+        FROM internal_sessions
+        WHERE id = ?
+        UNION ALL
+        SELECT {', '.join('s.' + col
+                          for col in _SESSION_COLUMNS.replace(', ', ',').split(','))}
+        FROM internal_sessions s
+        JOIN lineage l ON s.id = l.parent_session_id
+    )
+    SELECT * FROM lineage
+"""
+
+# One atomic flip: clears the old current flag and sets the new one for
+# the whole external session in a single statement (and single fsync).
+_SQL_SET_CURRENT = """
+    UPDATE internal_sessions
+    SET is_current = CASE WHEN id = ?1 THEN 1 ELSE 0 END
+    WHERE external_session_id = (
+        SELECT external_session_id FROM internal_sessions WHERE id = ?1
+    )
+"""
+
+# Entries kept in the langgraph-id lookup cache
+_LG_CACHE_SIZE = 128
+
+# Entries kept in the last-seen-blob cache used by update() to skip
+# rewriting unchanged JSON columns.
+_BLOB_CACHE_SIZE = 256
+
+# update() always writes the cheap scalar columns; the JSON blob columns
+# are appended only when their encoded bytes changed. One SQL string is
+# cached per blob-column subset (8 variants) so each stays a single
+# prepared statement in the connection's cache.
+_UPDATE_SCALAR_SET = "is_current = ?, checkpoint_count = ?, tool_invocation_count = ?"
+
+_BLOB_COLUMNS = ("state_data", "conversation_history", "metadata")
+
+_UPDATE_SQL_VARIANTS = {}
+
+
+def _update_sql(changed: tuple) -> str:
+    """Get (and cache) the UPDATE statement for a set of changed blobs."""
+    sql = _UPDATE_SQL_VARIANTS.get(changed)
+    if sql is None:
+        sets = _UPDATE_SCALAR_SET
+        for column in changed:
+            sets += f", {column} = ?"
+        sql = f"UPDATE internal_sessions SET {sets} WHERE id = ?"
+        _UPDATE_SQL_VARIANTS[changed] = sql
+    return sql
+
+_SQL_DELETE = "DELETE FROM internal_sessions WHERE id = ?"
+
+_SQL_COUNT = "SELECT COUNT(*) FROM internal_sessions WHERE external_session_id = ?"
+
+_SQL_UPDATE_TOOL_COUNT = """
+    UPDATE internal_sessions 
+    SET tool_invocation_count = tool_invocation_count + ?
+    WHERE id = ?
+"""
+
+_SQL_UNCURRENT_ALL = """
+    UPDATE internal_sessions
+    SET is_current = 0
+    WHERE external_session_id = ? AND is_current = 1
+"""
+
+_SQL_UNCURRENT_EXCEPT = """
+    UPDATE internal_sessions
+    SET is_current = 0
+    WHERE external_session_id = ? AND id != ? AND is_current = 1
+"""
+
+
+class InternalSessionRepository(SharedConnectionMixin):
     """Repository for InternalSession CRUD operations with SQLite.
     
     Manages internal langgraph sessions which are the actual agent sessions
@@ -28,23 +203,50 @@ class InternalSessionRepository:
         >>> saved = repo.create(session)
         >>> sessions = repo.get_by_external_session(1)
     """
-    
+
+    _savepoint_prefix = "session_txn"
+
     def __init__(self, db_path: Optional[str] = None):
         """Initialize the internal session repository.
-        
+
         Args:
             db_path: Path to SQLite database. If None, uses configured default.
         """
         self.db_path = db_path or get_database_path()
+        self._init_connection_state()
+        self._lg_cache: "OrderedDict[str, InternalSession]" = OrderedDict()
+        self._blob_cache: "OrderedDict[int, tuple]" = OrderedDict()
         self._init_db()
-    
+
+    def _remember_blobs(self, session_id: int, blobs: tuple):
+        """Record the encoded JSON columns last seen for a row."""
+        cache = self._blob_cache
+        cache[session_id] = blobs
+        cache.move_to_end(session_id)
+        if len(cache) > _BLOB_CACHE_SIZE:
+            cache.popitem(last=False)
+
+    @staticmethod
+    def _cache_copy(session: InternalSession) -> InternalSession:
+        """Copy a cached session, detaching its mutable containers.
+
+        Callers append messages and merge state into the returned object;
+        fresh top-level containers keep those edits out of the cache. The
+        message dicts themselves are shared — the model treats them as
+        append-only.
+        """
+        out = copy.copy(session)
+        out.session_state = dict(session.session_state)
+        out.conversation_history = list(session.conversation_history)
+        out.metadata = dict(session.metadata)
+        # Tally dict would otherwise be shared with the cached original.
+        out._role_counts = None
+        return out
+
     def _init_db(self):
         """Initialize the internal sessions table if it doesn't exist."""
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS internal_sessions (
@@ -53,7 +255,7 @@ class InternalSessionRepository:
                     langgraph_session_id TEXT UNIQUE NOT NULL,
                     state_data TEXT,
                     conversation_history TEXT,
-                    created_at TEXT NOT NULL,
+                    created_at INTEGER NOT NULL,
                     is_current INTEGER DEFAULT 0,
                     checkpoint_count INTEGER DEFAULT 0,
                     parent_session_id INTEGER,
@@ -82,6 +284,28 @@ class InternalSessionRepository:
             
             if 'metadata' not in columns:
                 cursor.execute("ALTER TABLE internal_sessions ADD COLUMN metadata TEXT")
+
+            # Migrate legacy ISO-string timestamps to epoch microseconds:
+            # integer ORDER BY and index keys beat 26-byte string compares,
+            # and reads skip fromisoformat. Legacy databases declare the
+            # column TEXT, so the converted value is stored back as a
+            # digit string — the LIKE guard (ISO strings contain '-',
+            # epoch strings don't) keeps the rewrite from re-running on
+            # already-converted rows, and reads coerce with int(). Within
+            # one database the storage class stays uniform (TEXT affinity
+            # coerces new integer binds too, and equal-width digit strings
+            # order the same as their values), so ORDER BY created_at
+            # never compares across storage classes. The 'utc' modifier
+            # matters: legacy strings are naive local times from
+            # datetime.now().isoformat(), and without it strftime reads
+            # them as UTC, permanently shifting every migrated session by
+            # the host's UTC offset.
+            cursor.execute("""
+                UPDATE internal_sessions
+                SET created_at = CAST(strftime('%s', created_at, 'utc') AS INTEGER) * 1000000
+                    + CAST(substr(created_at, 21, 6) AS INTEGER)
+                WHERE typeof(created_at) = 'text' AND created_at LIKE '%-%'
+            """)
             
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_internal_sessions_external 
@@ -94,19 +318,45 @@ class InternalSessionRepository:
             """)
             
             cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_internal_sessions_parent 
+                CREATE INDEX IF NOT EXISTS idx_internal_sessions_parent
                 ON internal_sessions(parent_session_id)
             """)
+
+            # Partial index with one entry per external session (only the
+            # current row), turning get_current_session and the uncurrent
+            # updates into point lookups.
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_internal_sessions_current
+                ON internal_sessions(external_session_id)
+                WHERE is_current = 1
+            """)
             
             cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_internal_sessions_branch 
+                CREATE INDEX IF NOT EXISTS idx_internal_sessions_branch
                 ON internal_sessions(branch_point_checkpoint_id)
             """)
-            
+
             conn.commit()
-        finally:
-            conn.close()
     
+    @staticmethod
+    def _session_to_row(session: InternalSession) -> tuple:
+        """Encode a session as an _SQL_INSERT parameter tuple."""
+        if not session.created_at:
+            session.created_at = datetime.now()
+        return (
+            session.external_session_id,
+            session.langgraph_session_id,
+            _dumps(session.session_state),
+            _dumps(session.conversation_history),
+            int(session.created_at.timestamp() * 1_000_000),
+            1 if session.is_current else 0,
+            session.checkpoint_count,
+            session.parent_session_id,
+            session.branch_point_checkpoint_id,
+            session.tool_invocation_count,
+            _dumps(session.metadata) if session.metadata else None
+        )
+
     def create(self, session: InternalSession) -> InternalSession:
         """Create a new internal session.
         
@@ -116,47 +366,64 @@ class InternalSessionRepository:
         Returns:
             The created session with id populated.
         """
-        if not session.created_at:
-            session.created_at = datetime.now()
-        
-        # Mark other sessions as not current
-        if session.is_current:
-            self._mark_all_not_current(session.external_session_id)
-        
-        session_dict = session.to_dict()
-        
-        conn = sqlite3.connect(self.db_path)
-        try:
+        row = self._session_to_row(session)
+
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
-            
-            cursor.execute("""
-                INSERT INTO internal_sessions 
-                (external_session_id, langgraph_session_id, state_data, conversation_history, 
-                 created_at, is_current, checkpoint_count, parent_session_id,
-                 branch_point_checkpoint_id, tool_invocation_count, metadata)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                session.external_session_id,
-                session.langgraph_session_id,
-                json.dumps(session.session_state),
-                json.dumps(session.conversation_history),
-                session.created_at.isoformat(),
-                1 if session.is_current else 0,
-                session.checkpoint_count,
-                session.parent_session_id,
-                session.branch_point_checkpoint_id,
-                session.tool_invocation_count,
-                json.dumps(session.metadata) if session.metadata else None
-            ))
-            
-            session.id = cursor.lastrowid
-            conn.commit()
-        finally:
-            conn.close()
-        
+
+            if session.is_current:
+                cursor.execute(_SQL_UNCURRENT_ALL, (session.external_session_id,))
+
+            cursor.execute(_SQL_INSERT_RETURNING, row)
+            session.id = cursor.fetchone()[0]
+
+            self._maybe_commit(conn)
+            self._lg_cache.clear()
+            self._remember_blobs(session.id, (row[2], row[3], row[10]))
+
         return session
+
+    def create_many(self, sessions: List[InternalSession]) -> List[InternalSession]:
+        """Create several internal sessions in a single transaction.
+
+        Branching workflows create sessions in bursts; inserting them one
+        commit at a time costs an fsync each. One executemany under a
+        single commit amortizes that. At most one session per external
+        session should be marked current.
+
+        Args:
+            sessions: InternalSession objects to create.
+
+        Returns:
+            The created sessions with ids populated.
+        """
+        if not sessions:
+            return []
+
+        rows = [self._session_to_row(session) for session in sessions]
+
+        with self._connection() as conn:
+            cursor = conn.cursor()
+
+            # Demote existing current sessions in the same transaction so
+            # all the writes share one commit.
+            for external_id in {s.external_session_id for s in sessions
+                                if s.is_current}:
+                cursor.execute(_SQL_UNCURRENT_ALL, (external_id,))
+
+            cursor.executemany(_SQL_INSERT, rows)
+
+            # Single statement under the repository lock, so the assigned
+            # rowids are contiguous; backfill ids from the last one.
+            cursor.execute("SELECT last_insert_rowid()")
+            first_id = cursor.fetchone()[0] - len(rows) + 1
+            for i, session in enumerate(sessions):
+                session.id = first_id + i
+
+            self._maybe_commit(conn)
+            self._lg_cache.clear()
+
+        return sessions
     
     def update(self, session: InternalSession) -> bool:
         """Update an existing internal session.
@@ -171,36 +438,49 @@ class InternalSessionRepository:
         """
         if not session.id:
             return False
-        
-        # Mark other sessions as not current if this one is current
-        if session.is_current:
-            self._mark_all_not_current(session.external_session_id, exclude_id=session.id)
-        
-        conn = sqlite3.connect(self.db_path)
-        try:
+
+        blobs = (
+            _dumps(session.session_state),
+            _dumps(session.conversation_history),
+            _dumps(session.metadata) if session.metadata else None,
+        )
+
+        with self._connection() as conn:
+            # Rewrite only the JSON columns whose bytes differ from what
+            # this repository last read or wrote for the row; an unchanged
+            # conversation history (usually the largest column) then never
+            # hits the page cache or the WAL. The repository is assumed to
+            # be the sole writer, the same assumption the lookup cache
+            # makes. Probed here, under the lock _connection holds, so it
+            # cannot race the clear()/pop() calls of other writers.
+            cached = self._blob_cache.get(session.id)
+            if cached is not None:
+                changed = tuple(column for column, new, old
+                                in zip(_BLOB_COLUMNS, blobs, cached)
+                                if new != old)
+            else:
+                changed = _BLOB_COLUMNS
+            params = [1 if session.is_current else 0,
+                      session.checkpoint_count,
+                      session.tool_invocation_count]
+            params.extend(new for column, new in zip(_BLOB_COLUMNS, blobs)
+                          if column in changed)
+            params.append(session.id)
+
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             
-            cursor.execute("""
-                UPDATE internal_sessions 
-                SET state_data = ?, conversation_history = ?, is_current = ?, 
-                    checkpoint_count = ?, tool_invocation_count = ?, metadata = ?
-                WHERE id = ?
-            """, (
-                json.dumps(session.session_state),
-                json.dumps(session.conversation_history),
-                1 if session.is_current else 0,
-                session.checkpoint_count,
-                session.tool_invocation_count,
-                json.dumps(session.metadata) if session.metadata else None,
-                session.id
-            ))
+            if session.is_current:
+                cursor.execute(_SQL_UNCURRENT_EXCEPT,
+                               (session.external_session_id, session.id))
             
-            conn.commit()
-            return cursor.rowcount > 0
-        finally:
-            conn.close()
+            cursor.execute(_update_sql(changed), params)
+            
+            self._maybe_commit(conn)
+            self._lg_cache.clear()
+            if cursor.rowcount > 0:
+                self._remember_blobs(session.id, blobs)
+                return True
+            return False
     
     def get_by_id(self, session_id: int) -> Optional[InternalSession]:
         """Get an internal session by ID.
@@ -211,26 +491,14 @@ class InternalSessionRepository:
         Returns:
             InternalSession if found, None otherwise.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             
-            cursor.execute("""
-                SELECT id, external_session_id, langgraph_session_id, state_data, 
-                       conversation_history, created_at, is_current, checkpoint_count,
-                       parent_session_id, branch_point_checkpoint_id, 
-                       tool_invocation_count, metadata
-                FROM internal_sessions
-                WHERE id = ?
-            """, (session_id,))
+            cursor.execute(_SQL_GET_BY_ID, (session_id,))
             
             row = cursor.fetchone()
             if row:
                 return self._row_to_session(row)
-        finally:
-            conn.close()
         
         return None
     
@@ -243,26 +511,25 @@ class InternalSessionRepository:
         Returns:
             InternalSession if found, None otherwise.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._lock:
+            cached = self._lg_cache.get(langgraph_session_id)
+            if cached is not None:
+                self._lg_cache.move_to_end(langgraph_session_id)
+                return self._cache_copy(cached)
+
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             
-            cursor.execute("""
-                SELECT id, external_session_id, langgraph_session_id, state_data, 
-                       conversation_history, created_at, is_current, checkpoint_count,
-                       parent_session_id, branch_point_checkpoint_id, 
-                       tool_invocation_count, metadata
-                FROM internal_sessions
-                WHERE langgraph_session_id = ?
-            """, (langgraph_session_id,))
+            cursor.execute(_SQL_GET_BY_LANGGRAPH, (langgraph_session_id,))
             
             row = cursor.fetchone()
             if row:
-                return self._row_to_session(row)
-        finally:
-            conn.close()
+                session = self._row_to_session(row)
+                with self._lock:
+                    self._lg_cache[langgraph_session_id] = self._cache_copy(session)
+                    while len(self._lg_cache) > _LG_CACHE_SIZE:
+                        self._lg_cache.popitem(last=False)
+                return session
         
         return None
     
@@ -275,27 +542,39 @@ class InternalSessionRepository:
         Returns:
             List of InternalSession objects, ordered by created_at descending.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             
-            cursor.execute("""
-                SELECT id, external_session_id, langgraph_session_id, state_data, 
-                       conversation_history, created_at, is_current, checkpoint_count,
-                       parent_session_id, branch_point_checkpoint_id, 
-                       tool_invocation_count, metadata
-                FROM internal_sessions
-                WHERE external_session_id = ?
-                ORDER BY created_at DESC
-            """, (external_session_id,))
+            cursor.execute(_SQL_GET_BY_EXTERNAL, (external_session_id,))
+            cursor.arraysize = 128
             
-            rows = cursor.fetchall()
-            return [self._row_to_session(row) for row in rows]
-        finally:
-            conn.close()
+            # Iterate the cursor directly instead of materializing all row
+            # tuples first; rows are decoded as they stream off the cursor.
+            to_session = self._row_to_session
+            return [to_session(row) for row in cursor]
     
+    def iter_by_external_session(self, external_session_id: int):
+        """Iterate over internal sessions for an external session.
+
+        Generator counterpart to get_by_external_session for callers that
+        only consume a prefix of a large result set.
+
+        Args:
+            external_session_id: The ID of the external session.
+
+        Yields:
+            InternalSession objects, ordered by created_at descending.
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.arraysize = 128
+            
+            cursor.execute(_SQL_GET_BY_EXTERNAL, (external_session_id,))
+            
+            to_session = self._row_to_session
+            for row in cursor:
+                yield to_session(row)
+
     def get_current_session(self, external_session_id: int) -> Optional[InternalSession]:
         """Get the current internal session for an external session.
         
@@ -305,27 +584,14 @@ class InternalSessionRepository:
         Returns:
             The current InternalSession if found, None otherwise.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             
-            cursor.execute("""
-                SELECT id, external_session_id, langgraph_session_id, state_data, 
-                       conversation_history, created_at, is_current, checkpoint_count,
-                       parent_session_id, branch_point_checkpoint_id, 
-                       tool_invocation_count, metadata
-                FROM internal_sessions
-                WHERE external_session_id = ? AND is_current = 1
-                LIMIT 1
-            """, (external_session_id,))
+            cursor.execute(_SQL_GET_CURRENT, (external_session_id,))
             
             row = cursor.fetchone()
             if row:
                 return self._row_to_session(row)
-        finally:
-            conn.close()
         
         return None
     
@@ -338,30 +604,16 @@ class InternalSessionRepository:
         Returns:
             True if successful, False if session not found.
         """
-        session = self.get_by_id(session_id)
-        if not session:
-            return False
-        
-        # Mark all others as not current
-        self._mark_all_not_current(session.external_session_id)
-        
-        # Mark this one as current
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             
-            cursor.execute("""
-                UPDATE internal_sessions 
-                SET is_current = 1
-                WHERE id = ?
-            """, (session_id,))
+            # A missing session id makes the subquery NULL, so no rows
+            # match and this correctly returns False.
+            cursor.execute(_SQL_SET_CURRENT, (session_id,))
             
-            conn.commit()
+            self._maybe_commit(conn)
+            self._lg_cache.clear()
             return cursor.rowcount > 0
-        finally:
-            conn.close()
     
     def delete(self, session_id: int) -> bool:
         """Delete an internal session.
@@ -372,20 +624,15 @@ class InternalSessionRepository:
         Returns:
             True if deletion successful, False otherwise.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             
-            cursor.execute("""
-                DELETE FROM internal_sessions WHERE id = ?
-            """, (session_id,))
-            
-            conn.commit()
+            cursor.execute(_SQL_DELETE, (session_id,))
+
+            self._maybe_commit(conn)
+            self._lg_cache.clear()
+            self._blob_cache.pop(session_id, None)
             return cursor.rowcount > 0
-        finally:
-            conn.close()
     
     def count_sessions(self, external_session_id: int) -> int:
         """Count internal sessions for an external session.
@@ -396,20 +643,12 @@ class InternalSessionRepository:
         Returns:
             Number of internal sessions.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             
-            cursor.execute("""
-                SELECT COUNT(*) FROM internal_sessions
-                WHERE external_session_id = ?
-            """, (external_session_id,))
+            cursor.execute(_SQL_COUNT, (external_session_id,))
             
             return cursor.fetchone()[0]
-        finally:
-            conn.close()
     
     def get_branch_sessions(self, parent_session_id: int) -> List[InternalSession]:
         """Get all sessions branched from a parent session.
@@ -420,26 +659,14 @@ class InternalSessionRepository:
         Returns:
             List of InternalSession objects branched from the parent.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             
-            cursor.execute("""
-                SELECT id, external_session_id, langgraph_session_id, state_data, 
-                       conversation_history, created_at, is_current, checkpoint_count,
-                       parent_session_id, branch_point_checkpoint_id, 
-                       tool_invocation_count, metadata
-                FROM internal_sessions
-                WHERE parent_session_id = ?
-                ORDER BY created_at DESC
-            """, (parent_session_id,))
-            
-            rows = cursor.fetchall()
-            return [self._row_to_session(row) for row in rows]
-        finally:
-            conn.close()
+            cursor.execute(_SQL_GET_BRANCHES, (parent_session_id,))
+            cursor.arraysize = 128
+
+            to_session = self._row_to_session
+            return [to_session(row) for row in cursor]
     
     def get_session_lineage(self, session_id: int) -> List[InternalSession]:
         """Get the lineage of a session (path from root to this session).
@@ -450,17 +677,17 @@ class InternalSessionRepository:
         Returns:
             List of InternalSession objects from root to current session.
         """
-        lineage = []
-        current_id = session_id
-        
-        while current_id:
-            session = self.get_by_id(current_id)
-            if not session:
-                break
-            lineage.append(session)
-            current_id = session.parent_session_id
-        
-        return list(reversed(lineage))
+        with self._connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute(_SQL_GET_LINEAGE, (session_id,))
+            rows = cursor.fetchall()
+
+            # Decoded while the lock is still held: _row_to_session feeds
+            # the blob cache, which must not be mutated concurrently with
+            # locked writers.
+            to_session = self._row_to_session
+            return [to_session(row) for row in reversed(rows)]
     
     def update_tool_count(self, session_id: int, increment: int = 1) -> bool:
         """Update the tool invocation count for a session.
@@ -472,22 +699,14 @@ class InternalSessionRepository:
         Returns:
             True if update successful, False otherwise.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             
-            cursor.execute("""
-                UPDATE internal_sessions 
-                SET tool_invocation_count = tool_invocation_count + ?
-                WHERE id = ?
-            """, (increment, session_id))
+            cursor.execute(_SQL_UPDATE_TOOL_COUNT, (increment, session_id))
             
-            conn.commit()
+            self._maybe_commit(conn)
+            self._lg_cache.clear()
             return cursor.rowcount > 0
-        finally:
-            conn.close()
     
     def _mark_all_not_current(self, external_session_id: int, exclude_id: Optional[int] = None):
         """Mark all internal sessions as not current for an external session.
@@ -496,28 +715,16 @@ class InternalSessionRepository:
             external_session_id: The ID of the external session.
             exclude_id: Optional ID to exclude from the update.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             
             if exclude_id:
-                cursor.execute("""
-                    UPDATE internal_sessions 
-                    SET is_current = 0
-                    WHERE external_session_id = ? AND id != ?
-                """, (external_session_id, exclude_id))
+                cursor.execute(_SQL_UNCURRENT_EXCEPT, (external_session_id, exclude_id))
             else:
-                cursor.execute("""
-                    UPDATE internal_sessions 
-                    SET is_current = 0
-                    WHERE external_session_id = ?
-                """, (external_session_id,))
+                cursor.execute(_SQL_UNCURRENT_ALL, (external_session_id,))
             
-            conn.commit()
-        finally:
-            conn.close()
+            self._maybe_commit(conn)
+            self._lg_cache.clear()
     
     def _row_to_session(self, row) -> InternalSession:
         """Convert a database row to an InternalSession object.
@@ -528,35 +735,33 @@ class InternalSessionRepository:
         Returns:
             InternalSession object.
         """
-        # Handle both old and new row formats
-        if len(row) == 8:
-            # Old format without new columns
-            (session_id, external_session_id, langgraph_session_id, state_data, 
-             conversation_history, created_at, is_current, checkpoint_count) = row
-            parent_session_id = None
-            branch_point_checkpoint_id = None
-            tool_invocation_count = 0
-            metadata = None
-        else:
-            # New format with all columns
-            (session_id, external_session_id, langgraph_session_id, state_data, 
-             conversation_history, created_at, is_current, checkpoint_count,
-             parent_session_id, branch_point_checkpoint_id, 
-             tool_invocation_count, metadata) = row
-        
-        session = InternalSession(
-            id=session_id,
-            external_session_id=external_session_id,
-            langgraph_session_id=langgraph_session_id,
-            session_state=json.loads(state_data) if state_data else {},
-            conversation_history=json.loads(conversation_history) if conversation_history else [],
-            created_at=datetime.fromisoformat(created_at) if created_at else None,
-            is_current=bool(is_current),
-            checkpoint_count=checkpoint_count or 0,
-            parent_session_id=parent_session_id,
-            branch_point_checkpoint_id=branch_point_checkpoint_id,
-            tool_invocation_count=tool_invocation_count or 0,
-            metadata=json.loads(metadata) if metadata else {}
-        )
-        
+        # _init_db migrates missing columns before any query runs, so every
+        # row has the full 12-column shape.
+        (session_id, external_session_id, langgraph_session_id, state_data,
+         conversation_history, created_at, is_current, checkpoint_count,
+         parent_session_id, branch_point_checkpoint_id,
+         tool_invocation_count, metadata) = row
+
+        self._remember_blobs(session_id, (state_data, conversation_history, metadata))
+
+        # Bypass the generated dataclass __init__ (keyword parsing plus
+        # default-factory calls for fields we overwrite anyway) — on bulk
+        # reads that dispatch is a measurable slice of per-row time.
+        session = InternalSession.__new__(InternalSession)
+        session.id = session_id
+        session.external_session_id = external_session_id
+        session.langgraph_session_id = langgraph_session_id
+        session.session_state = _loads(state_data) if state_data else {}
+        session.conversation_history = _loads(conversation_history) if conversation_history else []
+        # int() tolerates the TEXT-affinity digit strings that upgraded
+        # legacy databases store (see the migration in _init_db).
+        session.created_at = _fromtimestamp(int(created_at) / 1_000_000) if created_at else None
+        session.is_current = bool(is_current)
+        session.checkpoint_count = checkpoint_count or 0
+        session.parent_session_id = parent_session_id
+        session.branch_point_checkpoint_id = branch_point_checkpoint_id
+        session.tool_invocation_count = tool_invocation_count or 0
+        session.metadata = _loads(metadata) if metadata else {}
+        session._role_counts = None
+
         return session
\ No newline at end of file
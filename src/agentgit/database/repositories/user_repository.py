@@ -3,27 +3,162 @@
 Provides ORM functionality for User entities with SQLite backend.
 """
 
-import sqlite3
 import json
-from typing import Optional, List
+import copy
+from collections import OrderedDict
+from typing import Iterator, Optional, List
 from datetime import datetime
 from pathlib import Path
 
 from agentgit.auth.user import User
 from agentgit.database.db_config import get_database_path
+from agentgit.database.sqlite_utils import SharedConnectionMixin
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
-class UserRepository:
+def _json_dumps(obj) -> str:
+    """Encode the user data blob, preferring orjson's C encoder.
+
+    The column stays TEXT (json_set patches it in place), so orjson's
+    bytes output is decoded back to str.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj)
+
+
+def _json_loads(data):
+    """Decode the user data blob."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _iso(dt: Optional[datetime]) -> Optional[str]:
+    """Format an optional datetime for storage."""
+    return dt.isoformat() if dt else None
+
+
+# Stamped into the data blob by _user_to_row. Blobs carrying the
+# current version were written with api_key/session_limit included, so
+# reads can skip the legacy column overlay.
+_DATA_SCHEMA_VERSION = 2
+
+_USER_COLUMNS = (
+    "id, username, password_hash, is_admin, created_at, last_login, "
+    "data, api_key, session_limit"
+)
+
+# SQL hoisted to module constants: the connection's statement cache is
+# keyed by statement text, so passing the identical string every call
+# skips the parse/plan step.
+_SQL_SEED_ROOT = """
+    INSERT OR IGNORE INTO users
+    (username, password_hash, is_admin, created_at, last_login, data, api_key, session_limit)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_SQL_INSERT = """
+    INSERT INTO users (username, password_hash, is_admin, created_at, last_login, data, api_key, session_limit)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_SQL_UPDATE = """
+    UPDATE users
+    SET username = ?, password_hash = ?, is_admin = ?,
+        created_at = ?, last_login = ?, data = ?, api_key = ?, session_limit = ?
+    WHERE id = ?
+"""
+
+# Variant used when the encoded blob matches what was last read or
+# written for the row: the columns still update but the (potentially
+# large) data text is not rewritten.
+_SQL_UPDATE_SKIP_DATA = """
+    UPDATE users
+    SET username = ?, password_hash = ?, is_admin = ?,
+        created_at = ?, last_login = ?, api_key = ?, session_limit = ?
+    WHERE id = ?
+"""
+
+_SQL_FIND_BY_ID = f"SELECT {_USER_COLUMNS} FROM users WHERE id = ?"
+
+_SQL_FIND_BY_USERNAME = f"SELECT {_USER_COLUMNS} FROM users WHERE username = ?"
+
+_SQL_FIND_ALL = f"SELECT {_USER_COLUMNS} FROM users"
+
+_SQL_FIND_BY_API_KEY = f"SELECT {_USER_COLUMNS} FROM users WHERE api_key = ?"
+
+# Hot-field updates: login timestamps and key rotation touch one value
+# each, so they patch the column plus the same key inside the data blob
+# rather than re-serializing the whole user through save(). On legacy
+# rows json_set(NULL, ...) leaves data NULL and reads keep using the
+# columns.
+_SQL_UPDATE_LAST_LOGIN = """
+    UPDATE users
+    SET last_login = ?1, data = json_set(data, '$.last_login', ?1)
+    WHERE id = ?2
+"""
+
+_SQL_UPDATE_API_KEY = """
+    UPDATE users
+    SET api_key = ?1, data = json_set(data, '$.api_key', ?1)
+    WHERE id = ?2
+"""
+
+_SQL_DELETE = "DELETE FROM users WHERE id = ?"
+
+# Narrow JSON patches: rewrite just the targeted key inside the data
+# blob server-side instead of reading the whole user and re-serializing
+# every field. Rows without a data blob (legacy) fall back to the
+# read-modify-write path, hence the data IS NOT NULL guard.
+_SQL_SET_ACTIVE_SESSIONS = """
+    UPDATE users
+    SET data = json_set(data, '$.active_sessions', json(?))
+    WHERE id = ? AND data IS NOT NULL
+"""
+
+_SQL_MERGE_PREFERENCES = """
+    UPDATE users
+    SET data = json_set(data, '$.preferences',
+                        json(json_patch(coalesce(json_extract(data, '$.preferences'), '{}'), ?)))
+    WHERE id = ? AND data IS NOT NULL
+"""
+
+# Intersects the stored active_sessions array with a bound JSON array of
+# still-active ids entirely server-side; json_group_array over zero
+# matches correctly yields [].
+_SQL_PRUNE_SESSIONS = """
+    UPDATE users
+    SET data = json_set(data, '$.active_sessions',
+                        (SELECT json_group_array(value)
+                         FROM json_each(data, '$.active_sessions')
+                         WHERE value IN (SELECT value FROM json_each(?))))
+    WHERE id = ? AND data IS NOT NULL
+"""
+
+# Entries kept in the lookup cache; each user occupies up to three slots
+# (id, username, api_key).
+_USER_CACHE_SIZE = 256
+
+# Entries kept in the last-seen-blob cache used by save() to skip
+# rewriting an unchanged data column.
+_DATA_CACHE_SIZE = 256
+
+
+class UserRepository(SharedConnectionMixin):
     """Repository for User CRUD operations with SQLite.
-    
+
     This class handles all database operations for User entities,
     including automatic initialization of the database schema and
     creation of the default admin user (rootusr).
-    
+
     Attributes:
         db_path: Path to the SQLite database file.
-    
+
     Example:
         >>> repo = UserRepository()
         >>> user = User(username="alice")
@@ -33,27 +168,76 @@ class UserRepository:
         >>> found_user.verify_password("secret")
         True
     """
+
+    _savepoint_prefix = "user_txn"
+
     def __init__(self, db_path: Optional[str] = None):
         """Initialize the user repository.
-        
+
         Args:
             db_path: Path to SQLite database file. If None, uses configured default.
         """
         self.db_path = db_path or get_database_path()
+        self._init_connection_state()
+        self._user_cache: "OrderedDict[tuple, User]" = OrderedDict()
+        self._data_cache: "OrderedDict[int, str]" = OrderedDict()
         self._init_db()
-    
+
+    def _remember_data(self, user_id: int, json_data: str):
+        """Record the encoded data blob last seen for a row."""
+        cache = self._data_cache
+        cache[user_id] = json_data
+        cache.move_to_end(user_id)
+        if len(cache) > _DATA_CACHE_SIZE:
+            cache.popitem(last=False)
+
+    @staticmethod
+    def _cache_copy(user: User) -> User:
+        """Copy a cached user, detaching its mutable containers.
+
+        Callers mutate active_sessions, preferences, and metadata on the
+        returned object; fresh containers keep those edits out of the
+        cache.
+        """
+        out = copy.copy(user)
+        out.active_sessions = list(user.active_sessions)
+        out.preferences = dict(user.preferences)
+        out.metadata = dict(user.metadata)
+        return out
+
+    def _cache_user(self, user: User):
+        """Store a user under its id, username, and api_key lookup keys."""
+        with self._lock:
+            cache = self._user_cache
+            cache[("id", user.id)] = user
+            cache[("name", user.username)] = user
+            if user.api_key is not None:
+                cache[("key", user.api_key)] = user
+            while len(cache) > _USER_CACHE_SIZE:
+                cache.popitem(last=False)
+
+    def _cached(self, key: tuple) -> Optional[User]:
+        """Return a detached copy of a cached user, if present.
+
+        Taken under the lock: writers clear the cache between the get
+        and the move_to_end otherwise.
+        """
+        with self._lock:
+            user = self._user_cache.get(key)
+            if user is None:
+                return None
+            self._user_cache.move_to_end(key)
+            return self._cache_copy(user)
+
     def _init_db(self):
         """Initialize database schema and create default admin user.
-        
+
         Creates the users table if it doesn't exist and ensures
         the rootusr admin account is present with default password "1234".
         Also handles migration for new fields.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS users (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -67,250 +251,278 @@ class UserRepository:
                     session_limit INTEGER DEFAULT 5
                 )
             """)
-            
+
             # Check if we need to add new columns (for migration)
             cursor.execute("PRAGMA table_info(users)")
             columns = [column[1] for column in cursor.fetchall()]
-            
+
             if 'api_key' not in columns:
                 cursor.execute("ALTER TABLE users ADD COLUMN api_key TEXT")
-            
+
             if 'session_limit' not in columns:
                 cursor.execute("ALTER TABLE users ADD COLUMN session_limit INTEGER DEFAULT 5")
-            
+
+            # find_by_api_key runs on every API request; without this the
+            # lookup is a full table scan (username already has the index
+            # implied by UNIQUE). Partial so NULL keys take no space.
             cursor.execute("""
-                SELECT COUNT(*) FROM users WHERE username = 'rootusr'
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_users_api_key
+                ON users(api_key) WHERE api_key IS NOT NULL
             """)
-            if cursor.fetchone()[0] == 0:
-                root_user = User(
-                    username="rootusr",
-                    is_admin=True,
-                    created_at=datetime.now()
-                )
-                root_user.set_password("1234")
-                self.save(root_user)
-            
+
+            # Seed the default admin with INSERT OR IGNORE so the common case
+            # (rootusr already present) is a single statement instead of a
+            # COUNT probe followed by a separate insert.
+            root_user = User(
+                username="rootusr",
+                is_admin=True,
+                created_at=datetime.now()
+            )
+            root_user.set_password("1234")
+            cursor.execute(_SQL_SEED_ROOT, self._user_to_row(root_user))
+
             conn.commit()
-        finally:
-            conn.close()
-    
+
     def save(self, user: User) -> User:
         """Save or update a user in the database.
-        
+
         Performs insert if user.id is None, otherwise updates existing record.
         Stores both structured fields and full JSON representation for flexibility.
-        
+
         Args:
             user: User object to save.
-            
+
         Returns:
             The saved User object with id populated if newly created.
-            
+
         Note:
             Password hash is stored separately from the JSON data for security.
         """
-        user_dict = user.to_dict()
-        user_dict['password_hash'] = user.password_hash
-        json_data = json.dumps(user_dict)
-        
-        conn = sqlite3.connect(self.db_path)
-        try:
+        params = self._user_to_row(user)
+        json_data = params[5]
+
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
-            
+
             if user.id is None:
-                cursor.execute("""
-                    INSERT INTO users (username, password_hash, is_admin, created_at, last_login, data, api_key, session_limit)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    user.username,
-                    user.password_hash,
-                    1 if user.is_admin else 0,
-                    user.created_at.isoformat() if user.created_at else None,
-                    user.last_login.isoformat() if user.last_login else None,
-                    json_data,
-                    user.api_key,
-                    user.session_limit
-                ))
+                cursor.execute(_SQL_INSERT, params)
                 user.id = cursor.lastrowid
+            elif self._data_cache.get(user.id) == json_data:
+                # Blob unchanged since this repository last read or wrote
+                # the row; update the scalar columns only. The repository
+                # is assumed to be the sole writer, as the lookup cache
+                # already assumes.
+                cursor.execute(_SQL_UPDATE_SKIP_DATA,
+                               params[:5] + params[6:] + (user.id,))
             else:
-                cursor.execute("""
-                    UPDATE users 
-                    SET username = ?, password_hash = ?, is_admin = ?, 
-                        created_at = ?, last_login = ?, data = ?, api_key = ?, session_limit = ?
-                    WHERE id = ?
-                """, (
-                    user.username,
-                    user.password_hash,
-                    1 if user.is_admin else 0,
-                    user.created_at.isoformat() if user.created_at else None,
-                    user.last_login.isoformat() if user.last_login else None,
-                    json_data,
-                    user.api_key,
-                    user.session_limit,
-                    user.id
-                ))
-            
-            conn.commit()
-        finally:
-            conn.close()
-        
+                cursor.execute(_SQL_UPDATE, params + (user.id,))
+
+            self._maybe_commit(conn)
+            self._user_cache.clear()
+            self._remember_data(user.id, json_data)
+
         return user
-    
+
+    @staticmethod
+    def _user_to_row(user: User) -> tuple:
+        """Encode a user as an INSERT/UPDATE parameter tuple.
+
+        Shared by save and save_many so the tuple (and the isoformat
+        calls inside it) is built exactly once per write.
+        """
+        user_dict = user.to_dict()
+        user_dict['password_hash'] = user.password_hash
+        user_dict['_v'] = _DATA_SCHEMA_VERSION
+        return (
+            user.username,
+            user.password_hash,
+            1 if user.is_admin else 0,
+            _iso(user.created_at),
+            _iso(user.last_login),
+            _json_dumps(user_dict),
+            user.api_key,
+            user.session_limit
+        )
+
+    def save_many(self, users: List[User]) -> List[User]:
+        """Insert several new users in a single transaction.
+
+        Bulk import paths pay one fsync for the whole batch instead of
+        one per user; a prepared statement is reused across rows via
+        executemany. Only inserts are supported — use save() to update
+        existing users.
+
+        Args:
+            users: User objects without ids to insert.
+
+        Returns:
+            The inserted users with ids populated.
+        """
+        if not users:
+            return []
+
+        rows = [self._user_to_row(user) for user in users]
+
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(_SQL_INSERT, rows)
+
+            # Single statement under the repository lock, so the assigned
+            # rowids are contiguous; backfill ids from the last one.
+            cursor.execute("SELECT last_insert_rowid()")
+            first_id = cursor.fetchone()[0] - len(rows) + 1
+            for i, user in enumerate(users):
+                user.id = first_id + i
+
+            self._maybe_commit(conn)
+            self._user_cache.clear()
+
+        return users
+
     def find_by_id(self, user_id: int) -> Optional[User]:
         """Find a user by their database ID.
-        
+
         Args:
             user_id: The unique identifier of the user.
-            
+
         Returns:
             User object if found, None otherwise.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        cached = self._cached(("id", user_id))
+        if cached is not None:
+            return cached
+
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
-            cursor.execute("""
-                SELECT id, username, password_hash, is_admin, created_at, last_login, data, api_key, session_limit
-                FROM users WHERE id = ?
-            """, (user_id,))
-            
+            cursor.execute(_SQL_FIND_BY_ID, (user_id,))
+
             row = cursor.fetchone()
             if row:
-                return self._row_to_user(row)
-        finally:
-            conn.close()
-        
+                user = self._row_to_user(row)
+                self._cache_user(user)
+                return self._cache_copy(user)
+
         return None
-    
+
     def find_by_username(self, username: str) -> Optional[User]:
         """Find a user by their username.
-        
+
         Args:
             username: The username to search for.
-            
+
         Returns:
             User object if found, None otherwise.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        cached = self._cached(("name", username))
+        if cached is not None:
+            return cached
+
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
-            cursor.execute("""
-                SELECT id, username, password_hash, is_admin, created_at, last_login, data, api_key, session_limit
-                FROM users WHERE username = ?
-            """, (username,))
-            
+            cursor.execute(_SQL_FIND_BY_USERNAME, (username,))
+
             row = cursor.fetchone()
             if row:
-                return self._row_to_user(row)
-        finally:
-            conn.close()
-        
+                user = self._row_to_user(row)
+                self._cache_user(user)
+                return self._cache_copy(user)
+
         return None
-    
+
     def find_all(self) -> List[User]:
         """Retrieve all users from the database.
-        
+
         Returns:
             List of all User objects in the database.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        return list(self.iter_all())
+
+    def iter_all(self) -> Iterator[User]:
+        """Iterate over all users without materializing the whole table.
+
+        Generator counterpart to find_all for callers that filter or
+        count; rows are decoded in driver-sized batches as they stream
+        off the cursor instead of being buffered twice up front.
+
+        Yields:
+            User objects.
+        """
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
-            cursor.execute("""
-                SELECT id, username, password_hash, is_admin, created_at, last_login, data, api_key, session_limit
-                FROM users
-            """)
-            
-            rows = cursor.fetchall()
-            return [self._row_to_user(row) for row in rows]
-        finally:
-            conn.close()
-    
+            cursor.arraysize = 256
+            cursor.execute(_SQL_FIND_ALL)
+
+            to_user = self._row_to_user
+            for row in cursor:
+                yield to_user(row)
+
     def find_by_api_key(self, api_key: str) -> Optional[User]:
         """Find a user by their API key.
-        
+
         Args:
             api_key: The API key to search for.
-            
+
         Returns:
             User object if found, None otherwise.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        cached = self._cached(("key", api_key))
+        if cached is not None:
+            return cached
+
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
-            cursor.execute("""
-                SELECT id, username, password_hash, is_admin, created_at, last_login, data, api_key, session_limit
-                FROM users WHERE api_key = ?
-            """, (api_key,))
-            
+            cursor.execute(_SQL_FIND_BY_API_KEY, (api_key,))
+
             row = cursor.fetchone()
             if row:
-                return self._row_to_user(row)
-        finally:
-            conn.close()
-        
+                user = self._row_to_user(row)
+                self._cache_user(user)
+                return self._cache_copy(user)
+
         return None
-    
+
     def update_last_login(self, user_id: int) -> bool:
         """Update the last login timestamp for a user.
-        
+
         Args:
             user_id: The ID of the user to update.
-            
+
         Returns:
             True if updated successfully, False otherwise.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
-            cursor.execute("""
-                UPDATE users SET last_login = ? WHERE id = ?
-            """, (datetime.now().isoformat(), user_id))
-            conn.commit()
+            cursor.execute(_SQL_UPDATE_LAST_LOGIN,
+                           (datetime.now().isoformat(), user_id))
+            self._maybe_commit(conn)
+            self._user_cache.clear()
+            self._data_cache.pop(user_id, None)
             return cursor.rowcount > 0
-        finally:
-            conn.close()
-    
+
     def update_api_key(self, user_id: int, api_key: Optional[str]) -> bool:
         """Update or remove a user's API key.
-        
+
         Args:
             user_id: The ID of the user to update.
             api_key: New API key or None to remove.
-            
+
         Returns:
             True if updated successfully, False otherwise.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
-            cursor.execute("""
-                UPDATE users SET api_key = ? WHERE id = ?
-            """, (api_key, user_id))
-            conn.commit()
+            cursor.execute(_SQL_UPDATE_API_KEY, (api_key, user_id))
+            self._maybe_commit(conn)
+            self._user_cache.clear()
+            self._data_cache.pop(user_id, None)
             return cursor.rowcount > 0
-        finally:
-            conn.close()
-    
+
     def get_user_sessions(self, user_id: int) -> List[int]:
         """Get all active session IDs for a user.
-        
+
         Args:
             user_id: The ID of the user.
-            
+
         Returns:
             List of active session IDs.
         """
@@ -318,104 +530,140 @@ class UserRepository:
         if user:
             return user.active_sessions
         return []
-    
+
     def update_user_sessions(self, user_id: int, session_ids: List[int]) -> bool:
         """Update the active sessions list for a user.
-        
+
         Args:
             user_id: The ID of the user.
             session_ids: New list of active session IDs.
-            
+
         Returns:
             True if updated successfully, False otherwise.
         """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(_SQL_SET_ACTIVE_SESSIONS,
+                           (_json_dumps(session_ids), user_id))
+            self._maybe_commit(conn)
+            self._user_cache.clear()
+            self._data_cache.pop(user_id, None)
+            if cursor.rowcount > 0:
+                return True
+
+        # Legacy row without a JSON blob: rebuild it through save().
         user = self.find_by_id(user_id)
         if user:
             user.active_sessions = session_ids
             self.save(user)
             return True
         return False
-    
+
     def update_user_preferences(self, user_id: int, preferences: dict) -> bool:
         """Update user preferences.
-        
+
         Args:
             user_id: The ID of the user.
             preferences: Dictionary of preferences to update.
-            
+
         Returns:
             True if updated successfully, False otherwise.
         """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(_SQL_MERGE_PREFERENCES,
+                           (_json_dumps(preferences), user_id))
+            self._maybe_commit(conn)
+            self._user_cache.clear()
+            self._data_cache.pop(user_id, None)
+            if cursor.rowcount > 0:
+                return True
+
+        # Legacy row without a JSON blob: rebuild it through save().
         user = self.find_by_id(user_id)
         if user:
             user.preferences.update(preferences)
             self.save(user)
             return True
         return False
-    
+
     def cleanup_inactive_sessions(self, user_id: int, active_session_ids: List[int]) -> bool:
         """Clean up inactive sessions for a user.
-        
+
         Removes session IDs that are no longer active from the user's active_sessions list.
-        
+
         Args:
             user_id: The ID of the user.
             active_session_ids: List of session IDs that are still active.
-            
+
         Returns:
             True if cleanup was performed, False otherwise.
         """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(_SQL_PRUNE_SESSIONS,
+                           (_json_dumps(list(active_session_ids)), user_id))
+            self._maybe_commit(conn)
+            self._user_cache.clear()
+            self._data_cache.pop(user_id, None)
+            if cursor.rowcount > 0:
+                return True
+
+        # Legacy row without a JSON blob: filter in Python with a set so
+        # the membership tests stay O(1), then rebuild through save().
         user = self.find_by_id(user_id)
         if user:
-            # Keep only sessions that are in the active list
-            user.active_sessions = [sid for sid in user.active_sessions if sid in active_session_ids]
+            active_set = set(active_session_ids)
+            user.active_sessions = [sid for sid in user.active_sessions
+                                    if sid in active_set]
             self.save(user)
             return True
         return False
-    
+
     def delete(self, user_id: int) -> bool:
         """Delete a user from the database.
-        
+
         Args:
             user_id: The ID of the user to delete.
-            
+
         Returns:
             True if a user was deleted, False if no user found.
         """
-        conn = sqlite3.connect(self.db_path)
-        try:
+        with self._connection() as conn:
             cursor = conn.cursor()
-            # Enable foreign key constraints
-            cursor.execute("PRAGMA foreign_keys = ON")
-            cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
-            conn.commit()
+            cursor.execute(_SQL_DELETE, (user_id,))
+            self._maybe_commit(conn)
+            self._user_cache.clear()
+            self._data_cache.pop(user_id, None)
             return cursor.rowcount > 0
-        finally:
-            conn.close()
-    
+
     def _row_to_user(self, row) -> User:
         """Convert a database row to a User object.
-        
+
         Args:
             row: Tuple containing database fields (id, username, password_hash,
                  is_admin, created_at, last_login, json_data, api_key, session_limit).
-            
+
         Returns:
             User object reconstructed from database data.
-            
+
         Note:
             Prioritizes JSON data if available, falls back to individual fields.
         """
         user_id, username, password_hash, is_admin, created_at, last_login, json_data, api_key, session_limit = row
-        
+
+        if json_data:
+            self._remember_data(user_id, json_data)
+
         if json_data:
-            user_dict = json.loads(json_data)
-            # Ensure api_key and session_limit from columns override JSON data
-            # This handles migration cases where JSON might not have these fields
-            if api_key is not None:
-                user_dict["api_key"] = api_key
-            if session_limit is not None:
-                user_dict["session_limit"] = session_limit
+            user_dict = _json_loads(json_data)
+            if user_dict.get("_v") != _DATA_SCHEMA_VERSION:
+                # Legacy blob written before api_key/session_limit were
+                # serialized: the columns are authoritative for those.
+                if api_key is not None:
+                    user_dict["api_key"] = api_key
+                if session_limit is not None:
+                    user_dict["session_limit"] = session_limit
         else:
             user_dict = {
                 "id": user_id,
@@ -429,10 +677,10 @@ class UserRepository:
                 "preferences": {},
                 "metadata": {}
             }
-        
+
         user_dict["password_hash"] = password_hash
-        
+
         user = User.from_dict(user_dict)
         user.id = user_id
-        
-        return user
\ No newline at end of file
+
+        return user
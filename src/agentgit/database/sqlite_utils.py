@@ -0,0 +1,179 @@
+"""Shared SQLite and compression plumbing for the repositories.
+
+The repository modules all keep one tuned connection per instance and
+compress large JSON payloads the same way. This module holds that
+plumbing once — connection pragmas, the shared-connection/transaction
+scaffolding, and the zstd helpers — so a fix lands in one place instead
+of being re-applied per repository.
+"""
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+if zstandard is not None:
+    # zstd contexts are stateful while a call is in flight and must not
+    # be shared across threads; keep one pair per thread. Payload
+    # encoding runs outside the repository locks, so concurrent writers
+    # would otherwise collide inside a single shared compressor.
+    _zstd_ctx = threading.local()
+
+    def zstd_compress(payload: bytes) -> bytes:
+        try:
+            compress = _zstd_ctx.compress
+        except AttributeError:
+            compress = _zstd_ctx.compress = zstandard.ZstdCompressor(level=3).compress
+        return compress(payload)
+
+    def zstd_decompress(data: bytes) -> bytes:
+        try:
+            decompress = _zstd_ctx.decompress
+        except AttributeError:
+            decompress = _zstd_ctx.decompress = zstandard.ZstdDecompressor().decompress
+        return decompress(data)
+
+# Standard zstd frame magic; lets readers tell compressed values from
+# raw JSON bytes so databases can mix both during migration.
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Payloads below this size gain nothing from compression.
+COMPRESS_MIN_SIZE = 512
+
+
+def maybe_compress(payload: bytes) -> bytes:
+    """Compress encoded payload bytes for storage when worthwhile."""
+    if zstandard is None or len(payload) < COMPRESS_MIN_SIZE:
+        return payload
+    return zstd_compress(payload)
+
+
+def maybe_decompress(data):
+    """Undo maybe_compress on a column value.
+
+    Accepts bytes from new rows or str from legacy TEXT rows; values
+    without the zstd magic pass through unchanged.
+    """
+    if isinstance(data, bytes) and data.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError(
+                "stored payload is zstd-compressed but the zstandard "
+                "package is not installed"
+            )
+        return zstd_decompress(data)
+    return data
+
+
+def open_tuned_connection(db_path: str) -> sqlite3.Connection:
+    """Open a SQLite connection with the shared pragma tuning applied."""
+    conn = sqlite3.connect(db_path, check_same_thread=False,
+                           cached_statements=256)
+    # Enable foreign key constraints once per connection
+    conn.execute("PRAGMA foreign_keys = ON")
+    # WAL lets readers proceed while writes commit; synchronous=NORMAL
+    # stays durable under WAL and drops one fsync per commit.
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -16384")
+    # Map the database file read-only (256 MB window); page reads become
+    # memory loads instead of read() syscalls, which matters for the
+    # blob-heavy JSON columns. No-op where mmap is unavailable.
+    conn.execute("PRAGMA mmap_size = 268435456")
+    return conn
+
+
+class SharedConnectionMixin:
+    """Shared-connection scaffolding for the SQLite repositories.
+
+    Keeps one tuned connection per repository instance behind an RLock
+    (a fresh connect per method paid file-open and per-connection setup
+    on every call and threw away SQLite's page cache each time), gates
+    per-call commits behind transaction() blocks, and turns nested
+    transaction() blocks into savepoints. Subclasses set ``db_path``
+    before first use, call _init_connection_state() in __init__, and
+    set _savepoint_prefix to keep savepoint names distinct per class.
+    """
+
+    _savepoint_prefix = "txn"
+
+    def _init_connection_state(self):
+        """Set up the lock, lazy connection slot, and nesting counter."""
+        self._lock = threading.RLock()
+        self._shared_conn: Optional[sqlite3.Connection] = None
+        self._txn_depth = 0
+
+    @contextmanager
+    def _connection(self):
+        """Yield the shared connection, opening it on first use.
+
+        Guarded by the RLock so the repository can be shared across
+        threads.
+        """
+        with self._lock:
+            if self._shared_conn is None:
+                self._shared_conn = open_tuned_connection(self.db_path)
+            yield self._shared_conn
+
+    def close(self):
+        """Close the shared connection.
+
+        The repository reopens lazily if used again; mainly useful for
+        services that cycle repositories and want file handles back
+        early.
+        """
+        with self._lock:
+            if self._shared_conn is not None:
+                self._shared_conn.close()
+                self._shared_conn = None
+
+    def _maybe_commit(self, conn: sqlite3.Connection):
+        """Commit now, unless a transaction() block will commit later."""
+        if self._txn_depth == 0:
+            conn.commit()
+
+    @contextmanager
+    def transaction(self):
+        """Group several repository calls into a single transaction.
+
+        Each write method normally commits (and fsyncs) on its own;
+        callers doing one logical unit of work across several calls can
+        batch them:
+
+            >>> with repo.transaction():
+            ...     repo.create(first)
+            ...     repo.update(second)
+
+        pays one fsync instead of two and makes the pair atomic. BEGIN
+        IMMEDIATE takes the write lock up front so the block cannot fail
+        on lock escalation halfway through; nested blocks become
+        savepoints.
+        """
+        with self._connection() as conn:
+            if self._txn_depth == 0:
+                conn.execute("BEGIN IMMEDIATE")
+            else:
+                conn.execute(f"SAVEPOINT {self._savepoint_prefix}_{self._txn_depth}")
+            self._txn_depth += 1
+            try:
+                yield self
+            except Exception:
+                self._txn_depth -= 1
+                if self._txn_depth == 0:
+                    conn.rollback()
+                else:
+                    conn.execute(
+                        f"ROLLBACK TO {self._savepoint_prefix}_{self._txn_depth}")
+                raise
+            else:
+                self._txn_depth -= 1
+                if self._txn_depth == 0:
+                    conn.commit()
+                else:
+                    conn.execute(
+                        f"RELEASE {self._savepoint_prefix}_{self._txn_depth}")
@@ -8,7 +8,7 @@ from datetime import datetime
 from typing import Optional, List, Dict, Any
 
 
-@dataclass
+@dataclass(slots=True)
 class ExternalSession:
     """External session model visible to users.
     
@@ -49,33 +49,45 @@ class ExternalSession:
     metadata: Dict[str, Any] = field(default_factory=dict)
     branch_count: int = 0
     total_checkpoints: int = 0
-    
-    def add_internal_session(self, session_id: str, is_branch: bool = False):
+    # Mirror of internal_session_ids for O(1) membership tests; the list
+    # keeps insertion order for display and serialization.
+    _internal_session_id_set: set = field(default_factory=set, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._internal_session_id_set = set(self.internal_session_ids)
+
+    def add_internal_session(self, session_id: str, is_branch: bool = False,
+                             *, now: Optional[datetime] = None):
         """Add a new internal session ID to this external session.
         
         Args:
             session_id: The internal session ID to add.
             is_branch: Whether this is a branch from a rollback.
+            now: Timestamp to record; callers adding in a loop can read
+                the clock once and pass it in.
         """
-        if session_id not in self.internal_session_ids:
+        if session_id not in self._internal_session_id_set:
+            self._internal_session_id_set.add(session_id)
             self.internal_session_ids.append(session_id)
             self.current_internal_session_id = session_id
             if is_branch:
                 self.branch_count += 1
-            self.updated_at = datetime.now()
+            self.updated_at = now or datetime.now()
     
-    def set_current_internal_session(self, session_id: str) -> bool:
+    def set_current_internal_session(self, session_id: str,
+                                     *, now: Optional[datetime] = None) -> bool:
         """Set the current active internal session.
         
         Args:
             session_id: The internal session ID to set as current.
+            now: Timestamp to record, for callers batching mutations.
             
         Returns:
             True if the session ID exists and was set, False otherwise.
         """
-        if session_id in self.internal_session_ids:
+        if session_id in self._internal_session_id_set:
             self.current_internal_session_id = session_id
-            self.updated_at = datetime.now()
+            self.updated_at = now or datetime.now()
             return True
         return False
     
@@ -92,19 +104,26 @@ class ExternalSession:
             "is_branched": self.branch_count > 0
         }
     
-    def update_metadata(self, metadata: Dict[str, Any]):
+    def update_metadata(self, metadata: Dict[str, Any],
+                        *, now: Optional[datetime] = None):
         """Update session metadata.
         
         Args:
             metadata: Metadata to merge with existing metadata.
+            now: Timestamp to record, for callers batching mutations.
         """
         self.metadata.update(metadata)
-        self.updated_at = datetime.now()
+        self.updated_at = now or datetime.now()
     
-    def increment_checkpoint_count(self):
-        """Increment the total checkpoint count."""
+    def increment_checkpoint_count(self, *, now: Optional[datetime] = None):
+        """Increment the total checkpoint count.
+
+        Args:
+            now: Timestamp to record; checkpoint-heavy loops can hoist
+                the clock read.
+        """
         self.total_checkpoints += 1
-        self.updated_at = datetime.now()
+        self.updated_at = now or datetime.now()
     
     def get_session_age(self) -> Optional[float]:
         """Get the age of the session in hours.
@@ -153,6 +172,7 @@ class ExternalSession:
         session.session_name = data.get("session_name", "")
         session.is_active = data.get("is_active", True)
         session.internal_session_ids = data.get("internal_session_ids", [])
+        session._internal_session_id_set = set(session.internal_session_ids)
         session.current_internal_session_id = data.get("current_internal_session_id")
         session.metadata = data.get("metadata", {})
         session.branch_count = data.get("branch_count", 0)
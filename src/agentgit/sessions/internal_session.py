@@ -3,13 +3,25 @@
 Represents the actual LangGraph agent sessions within an external session.
 """
 
+from collections import Counter
 from dataclasses import dataclass, field
 from datetime import datetime
+from os import urandom
 from typing import Optional, Dict, List, Any
-import json
+import sys
 
+# Interned role constants: identical interned strings compare by pointer,
+# which keeps role checks over long histories cheap.
+_USER = sys.intern("user")
 
-@dataclass
+try:  # pragma: no cover - exercised when orjson is installed
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+    import json
+
+
+@dataclass(slots=True)
 class InternalSession:
     """Internal session model for LangGraph agents.
     
@@ -50,7 +62,11 @@ class InternalSession:
     branch_point_checkpoint_id: Optional[int] = None
     tool_invocation_count: int = 0
     metadata: Dict[str, Any] = field(default_factory=dict)
-    
+    # Per-role message tallies backing both turn numbers and
+    # get_statistics. None means "not yet counted": one Counter pass
+    # materializes it on first use, then every append is an O(1) update.
+    _role_counts: Optional[Dict[str, int]] = field(default=None, repr=False, compare=False)
+
     def add_message(self, role: str, content: str, **kwargs):
         """Add a message to the conversation history.
         
@@ -59,22 +75,34 @@ class InternalSession:
             content: The message content.
             **kwargs: Additional message metadata.
         """
+        if type(role) is str:
+            role = sys.intern(role)
+        counts = self._ensure_role_counts()
+        counts[role] = counts.get(role, 0) + 1
+        turn_number = counts[role] if role == _USER else None
+
         message = {
             "role": role,
             "content": content,
             "timestamp": datetime.now().isoformat(),
-            "turn_number": len([m for m in self.conversation_history if m.get("role") == "user"]) + 1 if role == "user" else None,
-            **kwargs
+            "turn_number": turn_number,
         }
+        if kwargs:
+            message.update(kwargs)
         self.conversation_history.append(message)
     
-    def update_state(self, new_state: Dict[str, Any]):
+    def update_state(self, new_state: Optional[Dict[str, Any]] = None, **kwargs):
         """Update the session state.
-        
+
         Args:
             new_state: Dictionary with state updates.
+            **kwargs: State updates as keyword arguments; skips the
+                temporary dict at the call site.
         """
-        self.session_state.update(new_state)
+        if new_state:
+            self.session_state.update(new_state)
+        if kwargs:
+            self.session_state.update(kwargs)
     
     def increment_tool_count(self, count: int = 1):
         """Increment the tool invocation counter.
@@ -98,43 +126,61 @@ class InternalSession:
         Returns:
             Dictionary with branch details.
         """
+        is_branch = self.parent_session_id is not None
         return {
-            "is_branch": self.is_branch(),
+            "is_branch": is_branch,
             "parent_session_id": self.parent_session_id,
             "branch_checkpoint_id": self.branch_point_checkpoint_id,
-            "created_from_rollback": self.is_branch()
+            "created_from_rollback": is_branch
         }
     
+    def _ensure_role_counts(self) -> Dict[str, int]:
+        """Materialize the per-role tallies from the history once."""
+        if self._role_counts is None:
+            self._role_counts = dict(Counter(
+                m.get("role") for m in self.conversation_history
+            ))
+        return self._role_counts
+
     def get_statistics(self) -> Dict[str, Any]:
         """Get session statistics.
         
         Returns:
             Dictionary with session statistics.
         """
-        user_messages = [m for m in self.conversation_history if m.get("role") == "user"]
-        assistant_messages = [m for m in self.conversation_history if m.get("role") == "assistant"]
-        
+        role_counts = self._ensure_role_counts()
+
         return {
             "total_messages": len(self.conversation_history),
-            "user_messages": len(user_messages),
-            "assistant_messages": len(assistant_messages),
+            "user_messages": role_counts.get("user", 0),
+            "assistant_messages": role_counts.get("assistant", 0),
             "checkpoints": self.checkpoint_count,
             "tool_invocations": self.tool_invocation_count,
             "is_active": self.is_current,
-            "is_branch": self.is_branch()
+            "is_branch": self.parent_session_id is not None
         }
     
-    def update_metadata(self, metadata: Dict[str, Any]):
+    def update_metadata(self, metadata: Optional[Dict[str, Any]] = None, **kwargs):
         """Update session metadata.
-        
+
         Args:
             metadata: Metadata to merge with existing metadata.
+            **kwargs: Metadata updates as keyword arguments; skips the
+                temporary dict at the call site.
         """
-        self.metadata.update(metadata)
+        if metadata:
+            self.metadata.update(metadata)
+        if kwargs:
+            self.metadata.update(kwargs)
     
-    def to_dict(self) -> dict:
+    def to_dict(self, for_orjson: bool = False) -> dict:
         """Convert internal session to dictionary representation.
-        
+
+        Args:
+            for_orjson: When True, leave created_at as a raw datetime so
+                orjson can format it natively instead of paying for
+                isoformat() in Python.
+
         Returns:
             Dictionary with session data.
         """
@@ -144,7 +190,8 @@ class InternalSession:
             "langgraph_session_id": self.langgraph_session_id,
             "session_state": self.session_state,
             "conversation_history": self.conversation_history,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "created_at": self.created_at if for_orjson
+                else (self.created_at.isoformat() if self.created_at else None),
             "is_current": self.is_current,
             "checkpoint_count": self.checkpoint_count,
             "parent_session_id": self.parent_session_id,
@@ -152,7 +199,20 @@ class InternalSession:
             "tool_invocation_count": self.tool_invocation_count,
             "metadata": self.metadata
         }
-    
+
+    def to_json(self) -> bytes:
+        """Serialize the session to JSON bytes.
+
+        Uses orjson when available, which formats the datetime natively;
+        falls back to stdlib json otherwise.
+
+        Returns:
+            UTF-8 encoded JSON document.
+        """
+        if orjson is not None:
+            return orjson.dumps(self.to_dict(for_orjson=True))
+        return json.dumps(self.to_dict()).encode()
+
     @classmethod
     def from_dict(cls, data: dict) -> "InternalSession":
         """Create an InternalSession from dictionary data.
@@ -178,11 +238,86 @@ class InternalSession:
         
         if data.get("created_at"):
             session.created_at = datetime.fromisoformat(data["created_at"])
-        
+
         return session
-    
+
+    @classmethod
+    def from_db_row(cls, data: dict) -> "InternalSession":
+        """Hydrate a session from a complete row dictionary.
+
+        Fast path for trusted payloads where every key is present, e.g.
+        rows shaped by the storage layer: skips the dataclass __init__
+        and from_dict's per-field .get() defaults in favor of plain
+        indexing. Use from_dict for partial or external payloads.
+
+        Args:
+            data: Dictionary containing all session keys.
+
+        Returns:
+            InternalSession instance.
+
+        Raises:
+            KeyError: If a session key is missing from data.
+        """
+        session = cls.__new__(cls)
+        session.id = data["id"]
+        session.external_session_id = data["external_session_id"]
+        session.langgraph_session_id = data["langgraph_session_id"]
+        session.session_state = data["session_state"]
+        session.conversation_history = data["conversation_history"]
+        session.is_current = data["is_current"]
+        session.checkpoint_count = data["checkpoint_count"]
+        session.parent_session_id = data["parent_session_id"]
+        session.branch_point_checkpoint_id = data["branch_point_checkpoint_id"]
+        session.tool_invocation_count = data["tool_invocation_count"]
+        session.metadata = data["metadata"]
+        created_at = data["created_at"]
+        session.created_at = (
+            datetime.fromisoformat(created_at) if created_at else None
+        )
+        session._role_counts = None
+        return session
+
+    @classmethod
+    def from_dicts(cls, rows: List[dict]) -> List["InternalSession"]:
+        """Hydrate many sessions from dictionaries in one pass.
+
+        Bulk counterpart to from_dict: bypasses the dataclass __init__
+        via __new__ and binds lookups once outside the loop, so per-row
+        cost is just the attribute writes.
+
+        Args:
+            rows: Dictionaries of session data, as produced by to_dict.
+
+        Returns:
+            List of InternalSession instances, one per row.
+        """
+        new = cls.__new__
+        fromiso = datetime.fromisoformat
+        out = []
+        append = out.append
+        for data in rows:
+            get = data.get
+            session = new(cls)
+            session.id = get("id")
+            session.external_session_id = get("external_session_id", 0)
+            session.langgraph_session_id = get("langgraph_session_id", "")
+            session.session_state = get("session_state") or {}
+            session.conversation_history = get("conversation_history") or []
+            session.is_current = get("is_current", True)
+            session.checkpoint_count = get("checkpoint_count", 0)
+            session.parent_session_id = get("parent_session_id")
+            session.branch_point_checkpoint_id = get("branch_point_checkpoint_id")
+            session.tool_invocation_count = get("tool_invocation_count", 0)
+            session.metadata = get("metadata") or {}
+            created_at = get("created_at")
+            session.created_at = fromiso(created_at) if created_at else None
+            session._role_counts = None
+            append(session)
+        return out
+
     @classmethod
-    def create_branch_from_checkpoint(cls, checkpoint, external_session_id: int, 
+    def create_branch_from_checkpoint(cls, checkpoint, external_session_id: int,
                                      parent_session_id: int) -> "InternalSession":
         """Create a new internal session branched from a checkpoint.
         
@@ -194,20 +329,19 @@ class InternalSession:
         Returns:
             New InternalSession branched from the checkpoint.
         """
-        import uuid
-        
+        now = datetime.now()
         session = cls(
             external_session_id=external_session_id,
-            langgraph_session_id=f"langgraph_{uuid.uuid4().hex[:12]}",
+            langgraph_session_id=f"langgraph_{urandom(6).hex()}",
             session_state=checkpoint.session_state.copy(),
             conversation_history=checkpoint.conversation_history.copy(),
-            created_at=datetime.now(),
+            created_at=now,
             is_current=True,
             parent_session_id=parent_session_id,
             branch_point_checkpoint_id=checkpoint.id,
             metadata={
                 "branched_from": checkpoint.checkpoint_name or f"Checkpoint {checkpoint.id}",
-                "branch_created_at": datetime.now().isoformat(),
+                "branch_created_at": now.isoformat(),
                 "session_type": "langgraph"
             }
         )
@@ -0,0 +1,232 @@
+"""Test suite for the legacy timestamp migrations.
+
+Verifies that databases created by older releases (ISO-string created_at
+columns) migrate to epoch microseconds correctly — in particular that
+naive local-time strings round-trip exactly on hosts away from UTC, and
+that re-running the migration is a no-op.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import unittest
+import tempfile
+import time
+import sqlite3
+import json
+from datetime import datetime
+
+from agentgit.checkpoints.checkpoint import Checkpoint
+from agentgit.database.repositories.checkpoint_repository import (
+    CheckpointRepository,
+    _ensure_schema,
+)
+from agentgit.database.repositories.internal_session_repository import (
+    InternalSessionRepository,
+)
+
+
+class NonUtcTimezoneTestCase(unittest.TestCase):
+    """Base class pinning the process to a UTC+10/+11 timezone.
+
+    The legacy columns hold naive local-time strings, so the migrations
+    only round-trip if SQLite interprets them in local time; running the
+    tests under a large-offset zone makes any UTC confusion visible.
+    """
+
+    def setUp(self):
+        """Switch the process timezone away from UTC."""
+        self._old_tz = os.environ.get("TZ")
+        os.environ["TZ"] = "Australia/Sydney"
+        time.tzset()
+
+        self.temp_db = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        self.db_path = self.temp_db.name
+        self.temp_db.close()
+
+    def tearDown(self):
+        """Restore the timezone and remove the temporary database."""
+        if self._old_tz is None:
+            os.environ.pop("TZ", None)
+        else:
+            os.environ["TZ"] = self._old_tz
+        time.tzset()
+        try:
+            os.unlink(self.db_path)
+        except:
+            pass
+
+
+class TestCheckpointCreatedAtMigration(NonUtcTimezoneTestCase):
+    """Migration tests for the checkpoints.created_at column."""
+
+    def _create_legacy_checkpoint_db(self, timestamps):
+        """Build a pre-migration checkpoints table with ISO-string rows."""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("""
+            CREATE TABLE checkpoints (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                internal_session_id INTEGER NOT NULL,
+                checkpoint_name TEXT,
+                checkpoint_data TEXT NOT NULL,
+                is_auto INTEGER DEFAULT 0,
+                created_at TEXT NOT NULL
+            )
+        """)
+        for i, created_at in enumerate(timestamps):
+            payload = json.dumps({
+                "id": None,
+                "internal_session_id": 1,
+                "checkpoint_name": f"cp{i}",
+                "session_state": {},
+                "conversation_history": [],
+                "is_auto": False,
+                "created_at": created_at.isoformat(),
+                "metadata": {},
+                "user_id": None,
+                "tool_invocations": []
+            })
+            conn.execute(
+                "INSERT INTO checkpoints (internal_session_id, checkpoint_name,"
+                " checkpoint_data, is_auto, created_at) VALUES (1, ?, ?, 0, ?)",
+                (f"cp{i}", payload, created_at.isoformat())
+            )
+        conn.commit()
+        conn.close()
+        _ensure_schema.cache_clear()
+
+    def test_migrated_epochs_round_trip_local_times(self):
+        """Migrated values must equal fromisoformat().timestamp()."""
+        timestamps = [
+            datetime(2025, 5, 1, 12, 0, 0, 123456),
+            datetime(2025, 1, 15, 23, 59, 59, 1),
+        ]
+        self._create_legacy_checkpoint_db(timestamps)
+
+        repo = CheckpointRepository(self.db_path)
+        repo.close()
+
+        conn = sqlite3.connect(self.db_path)
+        stored = [row[0] for row in conn.execute(
+            "SELECT created_at FROM checkpoints ORDER BY id")]
+        conn.close()
+
+        expected = [int(ts.timestamp() * 1_000_000) for ts in timestamps]
+        self.assertEqual([int(value) for value in stored], expected)
+
+    def test_latest_checkpoint_not_shadowed_by_migrated_rows(self):
+        """A post-upgrade checkpoint must outrank pre-upgrade ones."""
+        # Written one minute before the upgrade; a UTC-confused migration
+        # would push it hours into the future and shadow new checkpoints.
+        self._create_legacy_checkpoint_db([datetime.now()])
+
+        repo = CheckpointRepository(self.db_path)
+        new_checkpoint = repo.create(Checkpoint(
+            internal_session_id=1,
+            checkpoint_name="post-upgrade"
+        ))
+
+        latest = repo.get_latest_checkpoint(1)
+        self.assertEqual(latest.id, new_checkpoint.id)
+        self.assertEqual(latest.checkpoint_name, "post-upgrade")
+        repo.close()
+        _ensure_schema.cache_clear()
+
+    def test_migration_is_idempotent(self):
+        """A second construction must leave migrated rows untouched."""
+        timestamp = datetime(2025, 5, 1, 12, 0, 0, 123456)
+        self._create_legacy_checkpoint_db([timestamp])
+
+        CheckpointRepository(self.db_path).close()
+        _ensure_schema.cache_clear()
+
+        # Second process: must not raise and must not change the value.
+        repo = CheckpointRepository(self.db_path)
+        conn = sqlite3.connect(self.db_path)
+        stored, = conn.execute("SELECT created_at FROM checkpoints").fetchone()
+        conn.close()
+        self.assertEqual(int(stored), int(timestamp.timestamp() * 1_000_000))
+        repo.close()
+        _ensure_schema.cache_clear()
+
+
+class TestInternalSessionCreatedAtMigration(NonUtcTimezoneTestCase):
+    """Migration tests for the internal_sessions.created_at column.
+
+    Unlike the checkpoint column this one is read back into the model,
+    so a UTC-confused migration corrupts created_at permanently.
+    """
+
+    def _create_legacy_session_db(self, timestamps):
+        """Build a pre-migration internal_sessions table with ISO rows."""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("""
+            CREATE TABLE internal_sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                external_session_id INTEGER NOT NULL,
+                langgraph_session_id TEXT UNIQUE NOT NULL,
+                state_data TEXT,
+                conversation_history TEXT,
+                created_at TEXT NOT NULL,
+                is_current INTEGER DEFAULT 0,
+                checkpoint_count INTEGER DEFAULT 0
+            )
+        """)
+        for i, created_at in enumerate(timestamps):
+            conn.execute(
+                "INSERT INTO internal_sessions (external_session_id,"
+                " langgraph_session_id, state_data, conversation_history,"
+                " created_at, is_current) VALUES (1, ?, '{}', '[]', ?, 0)",
+                (f"lg_{i}", created_at.isoformat())
+            )
+        conn.commit()
+        conn.close()
+
+    def test_created_at_round_trips_local_times(self):
+        """Sessions must read back the exact datetime that was stored."""
+        timestamps = [
+            datetime(2025, 5, 1, 10, 0, 0, 123456),
+            datetime(2025, 1, 15, 23, 59, 59, 1),
+        ]
+        self._create_legacy_session_db(timestamps)
+
+        repo = InternalSessionRepository(self.db_path)
+        for i, timestamp in enumerate(timestamps):
+            session = repo.get_by_id(i + 1)
+            self.assertEqual(session.created_at, timestamp)
+        repo.close()
+
+    def test_migration_is_idempotent(self):
+        """A second construction must leave migrated rows untouched."""
+        timestamp = datetime(2025, 5, 1, 10, 0, 0, 123456)
+        self._create_legacy_session_db([timestamp])
+
+        InternalSessionRepository(self.db_path).close()
+        repo = InternalSessionRepository(self.db_path)
+        self.assertEqual(repo.get_by_id(1).created_at, timestamp)
+        repo.close()
+
+    def test_ordering_spans_migrated_and_new_rows(self):
+        """created_at DESC ordering must hold across old and new rows."""
+        self._create_legacy_session_db([
+            datetime(2025, 5, 1, 10, 0, 0),
+            datetime(2025, 5, 2, 10, 0, 0),
+        ])
+
+        from agentgit.sessions.internal_session import InternalSession
+        repo = InternalSessionRepository(self.db_path)
+        repo.create(InternalSession(
+            external_session_id=1,
+            langgraph_session_id="lg_new",
+            created_at=datetime(2025, 5, 3, 10, 0, 0),
+            is_current=False
+        ))
+        ordered = [s.langgraph_session_id
+                   for s in repo.get_by_external_session(1)]
+        self.assertEqual(ordered, ["lg_new", "lg_1", "lg_0"])
+        repo.close()
+
+
+if __name__ == '__main__':
+    unittest.main()